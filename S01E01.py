@@ -1,9 +1,9 @@
 import os
 import re
-import requests
 from dotenv import load_dotenv
 from loguru import logger
 from utils_ai import openai_create
+from utils_http import http_client
 
 
 load_dotenv()
@@ -11,7 +11,7 @@ load_dotenv()
 
 def run():
     url = os.getenv("S01E01_URL")
-    response = requests.get(url)
+    response = http_client.get(url)
     html_content = response.text
     question_match = re.search(
         r'<p id="human-question">Question:<br />(.*?)</p>', html_content
@@ -34,7 +34,7 @@ def run():
         "answer": int(answer.content),
     }
     logger.debug(f"Payload: {payload}")
-    response = requests.post(url, data=payload)
+    response = http_client.post(url, data=payload)
     if response.status_code == 200:
         logger.success(f"Request successful! Response:, {response.content}")
     else:
@@ -1,9 +1,9 @@
 import json
 import os
-import requests
 from dotenv import load_dotenv
 from loguru import logger
 from utils_ai import openai_create
+from utils_http import http_client
 
 
 load_dotenv()
@@ -12,7 +12,7 @@ load_dotenv()
 def run():
     url = os.getenv("S01E02_URL")
     initial_message = {"text": "READY", "msgID": "0"}
-    initial_response = requests.get(url, json=initial_message)
+    initial_response = http_client.get(url, json=initial_message)
     response_dict = json.loads(initial_response.text)
     msgID = response_dict["msgID"]
     human_template = response_dict["text"]
@@ -24,7 +24,7 @@ def run():
     """
     answer = openai_create(system_template, human_template)
     answer_message = {"text": answer.content, "msgID": str(msgID)}
-    response = requests.get(url, json=answer_message)
+    response = http_client.get(url, json=answer_message)
     logger.debug(f"{human_template}\n {answer.content}")
     if response.status_code == 200:
         logger.success(f"Request successful! Response:, {response.content}")
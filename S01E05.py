@@ -1,16 +1,17 @@
 import os
 import json
-import requests
 from dotenv import load_dotenv
 from loguru import logger
-from utils_ai import aidevs_send_answer, generate_local_llm_response
+from utils_ai import aidevs_send_answer
+from utils_http import http_client
+from utils_router import router
 
 
 load_dotenv()
 
 
 def run():
-    response = requests.get(os.getenv("S01E05_URL"))
+    response = http_client.get(os.getenv("S01E05_URL"))
     human_template = response.text
     logger.debug(f"Human template: {human_template}")
 
@@ -43,8 +44,10 @@ def run():
     AI: {\"result\":\"Podejrzany: CENZURA. Mieszka w CENZURA przy ul. CENZURA. Ma CENZURA lat."}"}
     """
 
-    response_llm = generate_local_llm_response(
-        system_template=system_template, human_template=human_template
+    response_llm = router.complete(
+        system_template=system_template,
+        human_template=human_template,
+        max_latency_seconds=30,
     )
     logger.debug(f"Response_llm: {response_llm}")
     response_llm_dict: dict = json.loads(response_llm)
@@ -3,7 +3,8 @@ import re
 from loguru import logger
 from typing import List, Optional
 
-from utils_ai import aidevs_send_answer, openai_create, whisper_transcribe
+from utils_ai import aidevs_send_answer, openai_create
+from utils_whisper import whisper_transcribe_many
 
 
 def extract_answer(text: str) -> Optional[str]:
@@ -35,8 +36,10 @@ def run():
     files: List[str] = [
         f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))
     ]
-    for file in files:
-        transcription = whisper_transcribe(f"{directory}{file}")
+    transcriptions: List[str] = whisper_transcribe_many(
+        [f"{directory}{file}" for file in files]
+    )
+    for file, transcription in zip(files, transcriptions):
         name: str = file.split(".")[0]
         human_template += f"{name}\n{transcription}\n###\n"
     logger.debug(f"HUMAN TEMPLATE: {human_template}")
@@ -1,12 +1,12 @@
 import os
-import requests
 from loguru import logger
 
 from utils_ai import aidevs_send_answer, openai_image_create
+from utils_http import http_client
 
 
 def run():
-    response = requests.get(os.getenv("S02E03_URL"))
+    response = http_client.get(os.getenv("S02E03_URL"))
     human_template: str = response.text
     logger.debug(f"Human template: {human_template}")
     response = openai_image_create(human_template)
@@ -2,21 +2,18 @@ import os
 from loguru import logger
 from typing import Dict
 
-from utils_ai import (
-    aidevs_send_answer,
-    openai_vision_create,
-    openai_create,
-    whisper_transcribe,
-)
-from utils_files_and_text import (
-    extract_answer,
-    group_files_by_type,
-)
+from utils_ai import aidevs_send_answer, batch_create
+from utils_files_and_text import extract_answer
+from utils_index import FileIndex
+from utils_whisper import whisper_transcribe_many
 
 
 def run():
     directory = "data/pliki_z_fabryki"
-    files = group_files_by_type(directory=directory)
+    # Only new or changed files are described and classified; earlier
+    # categories are kept in the index.
+    index = FileIndex(directory, "S02E04", recursive=False)
+    files = index.scan()
     system_template_vision = """
     Prompt:
     
@@ -80,26 +77,54 @@ def run():
     <ANSWER>people</ANSWER>
     """
     text_dict = dict()
-    for image_name in files["Images"]:
-        image = open(os.path.join(directory, image_name), "rb")
-        response = openai_vision_create(
-            system_template_vision, "", [image], model="gpt-4o-mini", temperature=0.1
+    # Image text and transcripts are cached by file content, so files already
+    # read by an earlier run are not sent to the models again.
+    image_texts = [
+        message.content
+        for message in batch_create(
+            [
+                {
+                    "system_template": system_template_vision,
+                    "human_template": "",
+                    "images": [open(os.path.join(directory, image_name), "rb")],
+                    "model": "gpt-4o-mini",
+                    "temperature": 0.1,
+                }
+                for image_name in files["Images"]
+            ]
         )
-        text_dict[image_name] = response.content
-    for audio in files["Audio"]:
-        transcription = whisper_transcribe(os.path.join(directory, audio))
+    ]
+    for image_name, image_text in zip(files["Images"], image_texts):
+        text_dict[image_name] = image_text
+
+    transcriptions = whisper_transcribe_many(
+        [os.path.join(directory, audio) for audio in files["Audio"]]
+    )
+    for audio, transcription in zip(files["Audio"], transcriptions):
         text_dict[audio] = transcription
     for txt in files["Text"]:
         with open(os.path.join(directory, txt), "r", encoding="utf-8") as txt_file:
             text_dict[txt] = txt_file.read()
 
+    responses = batch_create(
+        [
+            {"system_template": system_template_chat, "human_template": file_content}
+            for file_content in text_dict.values()
+        ]
+    )
     result_data = {"people": [], "hardware": [], "others": []}
-    for file_name, file_content in text_dict.items():
-        human_template = file_content
-        response = openai_create(system_template_chat, human_template)
+    for file_name, response in zip(text_dict.keys(), responses):
         logger.debug(f"File: {file_name} LLM answer: {response.content}")
         answer = extract_answer(response.content)
-        result_data[answer].append(file_name)
+        if answer in result_data:
+            index.set_result(file_name, answer)
+        else:
+            logger.warning(f"No category for {file_name}, will retry next run")
+            index.discard(file_name)
+    index.commit()
+
+    for file_name in index.entries:
+        result_data[index.result(file_name)].append(file_name)
 
     answer_data: Dict[str, str] = {
         key: result_data[key] for key in ["people", "hardware"]
@@ -1,18 +1,19 @@
 import os
-import requests
 from loguru import logger
 
 from utils_ai import (
     aidevs_send_answer,
-    openai_create,
-    openai_vision_create,
-    whisper_transcribe,
+    batch_create,
+    openai_answer_questions,
 )
 from utils_files_and_text import (
     group_files_by_type,
     replace_placeholders_in_text,
     transfer_webpage_to_markdown,
 )
+from utils_http import http_client
+from utils_tokens import ContextBudget
+from utils_whisper import whisper_transcribe_many
 
 
 def run():
@@ -77,17 +78,36 @@ def run():
     transfer_webpage_to_markdown(url_article, output_directory, markdown_name)
 
     grouped_files = group_files_by_type(output_directory)
-    image_descriptions = dict()
-    for image_name in grouped_files["Images"]:
-        image = open(os.path.join(output_directory, image_name), "rb")
-        response = openai_vision_create(
-            system_template_vision, "", [image], model="gpt-4o-mini", temperature=0.1
+    # Descriptions and transcripts are cached by file content, so assets seen
+    # by an earlier run (under any name) are not sent to the models again.
+    descriptions = [
+        message.content
+        for message in batch_create(
+            [
+                {
+                    "system_template": system_template_vision,
+                    "human_template": "",
+                    "images": [open(os.path.join(output_directory, image_name), "rb")],
+                    "model": "gpt-4o-mini",
+                    "temperature": 0.1,
+                    "preprocess_options": {"max_long_edge": 1024},
+                }
+                for image_name in grouped_files["Images"]
+            ]
         )
-        logger.debug(f"IMAGE DESCRIPTION: {image_name}\n{response.content}")
-        image_descriptions[image_name] = response.content
+    ]
+    image_descriptions = dict()
+    for image_name, description in zip(grouped_files["Images"], descriptions):
+        logger.debug(f"IMAGE DESCRIPTION: {image_name}\n{description}")
+        image_descriptions[image_name] = description
     audio_transcriptions = dict()
-    for audio_name in grouped_files["Audio"]:
-        transcription = whisper_transcribe(os.path.join(output_directory, audio_name))
+    transcriptions = whisper_transcribe_many(
+        [
+            os.path.join(output_directory, audio_name)
+            for audio_name in grouped_files["Audio"]
+        ]
+    )
+    for audio_name, transcription in zip(grouped_files["Audio"], transcriptions):
         logger.debug(f"AUDIO TRANSCRIPTION: {audio_name}\n{transcription}")
         audio_transcriptions[audio_name] = transcription
 
@@ -100,8 +120,13 @@ def run():
         markdown_content, image_descriptions, audio_transcriptions
     )
     logger.debug("Webpage_complete_data is completed")
+    webpage_complete_data = (
+        ContextBudget(model="gpt-4o-mini", reserved_tokens=4_096)
+        .add("webpage", webpage_complete_data, trim="keep_start")
+        .build()
+    )
 
-    questions_response = requests.get(url_questions)
+    questions_response = http_client.get(url_questions)
     questions = questions_response.text
     logger.debug(f"QUESTIONS: {questions}")
 
@@ -112,14 +137,11 @@ def run():
             key, value = line.split("=", 1)  # Split only at the first '='
             questions_dict[key.strip()] = value.strip()
 
-    answers = {}
+    answers = openai_answer_questions(
+        webpage_complete_data, questions_dict, system_template_chat
+    )
     for question_id, question_content in questions_dict.items():
-        response = openai_create(
-            f"{webpage_complete_data}\n{system_template_chat}", question_content
-        )
-        answer = response.content
-        logger.debug(f"QUESTION: {question_content}\nANSWER: {answer}")
-        answers[question_id] = answer
+        logger.debug(f"QUESTION: {question_content}\nANSWER: {answers[question_id]}")
     logger.debug(f"FINAL ANSWERS: {answers}")
 
     response_task = aidevs_send_answer(
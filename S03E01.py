@@ -3,33 +3,45 @@ from loguru import logger
 
 from utils_ai import (
     aidevs_send_answer,
-    openai_create,
-)
-from utils_files_and_text import (
-    extract_answer,
-    group_files_by_type,
+    batch_create,
 )
+from utils_files_and_text import extract_answer
+from utils_index import FileIndex
+from utils_tokens import ContextBudget, count_tokens
 
 
 def run():
     directory_reports: str = "data/pliki_z_fabryki"
     directory_facts: str = "data/pliki_z_fabryki/facts"
-    reports = group_files_by_type(directory_reports, file_types={".txt": "Text"})
-    facts = group_files_by_type(directory_facts, file_types={".txt": "Text"})
-    context = ""
+    report_index = FileIndex(
+        directory_reports, "S03E01", file_types={".txt": "Text"}, recursive=False
+    )
+    fact_index = FileIndex(directory_facts, "S03E01", file_types={".txt": "Text"})
+    # Every report and fact goes into the shared context, so any change means
+    # all keywords are regenerated; an unchanged corpus reuses the stored ones.
+    changed_reports = report_index.scan()
+    changed_facts = fact_index.scan()
+    stale: bool = bool(
+        changed_reports
+        or changed_facts
+        or report_index.removed
+        or fact_index.removed
+        or any(report_index.result(report) is None for report in report_index.entries)
+    )
+    reports = report_index.files()
+    facts = fact_index.files()
     reports_content = dict()
     for report in reports["Text"]:
         with open(
             os.path.join(directory_reports, report), "r", encoding="utf-8"
         ) as file:
-            content = file.read().strip()
-            reports_content[report] = content
-            context = f"{context}\n###\n{content}"
+            reports_content[report] = file.read().strip()
+    facts_content = dict()
     for fact in facts["Text"]:
         with open(os.path.join(directory_facts, fact), "r", encoding="utf-8") as file:
             content = file.read().strip()
             if not content == "entry deleted":
-                context = f"{context}\n###\n{content}"
+                facts_content[fact] = content
 
     prompt: str = """
         ### Prompt:
@@ -59,21 +71,47 @@ def run():
         <ANSWER>Aleksander Ragowski, nauczyciel, Grudziądz, szkoła podstawowa, policja, schwytanie</ANSWER>
         ```
     """
-    system_template: str = f"{prompt}<CONTEXT>{context}</CONTEXT>"
-    logger.debug(f"SYSTEM TEMPLATE: {system_template}")
     answer = dict()
-    for report_name, report_content in reports_content.items():
-        human_template: str = (
-            f"<FILENAME>{report_name}</FILENAME><INPUT>{report_content}</INPUT>"
-        )
-        response_keywords = openai_create(
-            system_template, human_template, model="gpt-4o"
+    if stale:
+        # Reports are what the keywords are generated for, so when the context
+        # does not fit next to the prompt and the largest report, facts are
+        # dropped first.
+        budget = ContextBudget(
+            model="gpt-4o",
+            reserved_tokens=count_tokens(prompt, "gpt-4o")
+            + max(
+                (count_tokens(c, "gpt-4o") for c in reports_content.values()), default=0
+            )
+            + 1_024,
         )
-        logger.debug(
-            f"Raport name: {report_name}, Response: {response_keywords.content}"
+        for report_name, report_content in reports_content.items():
+            budget.add(f"report:{report_name}", report_content, priority=2)
+        for fact_name, fact_content in facts_content.items():
+            budget.add(f"fact:{fact_name}", fact_content, priority=1)
+        context: str = "\n###\n" + budget.build(separator="\n###\n")
+        system_template: str = f"{prompt}<CONTEXT>{context}</CONTEXT>"
+        logger.debug(f"SYSTEM TEMPLATE: {system_template}")
+        responses = batch_create(
+            [
+                {
+                    "system_template": system_template,
+                    "human_template": f"<FILENAME>{report_name}</FILENAME><INPUT>{report_content}</INPUT>",
+                    "model": "gpt-4o",
+                }
+                for report_name, report_content in reports_content.items()
+            ]
         )
-        answer[report_name] = extract_answer(response_keywords.content)
-        logger.debug(f"KEYWORDS: {answer[report_name]}")
+        for report_name, response_keywords in zip(reports_content.keys(), responses):
+            logger.debug(
+                f"Raport name: {report_name}, Response: {response_keywords.content}"
+            )
+            answer[report_name] = extract_answer(response_keywords.content)
+            report_index.set_result(report_name, answer[report_name])
+            logger.debug(f"KEYWORDS: {answer[report_name]}")
+        report_index.commit()
+        fact_index.commit()
+    else:
+        answer = {report: report_index.result(report) for report in reports["Text"]}
     logger.info(f"ANSWER DICT: {answer}")
 
     response_task = aidevs_send_answer(
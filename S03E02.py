@@ -1,35 +1,58 @@
 import os
 import uuid
 from loguru import logger
-from utils_ai import aidevs_send_answer, openai_get_embedding
-from utils_files_and_text import group_files_by_type
-from utils_qdrant import qdrant_create_collection, qdrant_upsert, query_similar_text
+from utils_ai import aidevs_send_answer, openai_get_embeddings
+from utils_index import FileIndex
+from utils_qdrant import (
+    qdrant_create_collection,
+    qdrant_delete,
+    qdrant_upsert,
+    query_similar_text,
+)
+
+
+def _point_id(file_name: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"S03E02/{file_name}"))
 
 
 def run():
     directory_weapons: str = "data/pliki_z_fabryki/weapons_tests/do-not-share"
     collection_name: str = "S03E02_large"
     question: str = os.getenv("S03E02_TASK_QUESTION")
-    weapon_files = group_files_by_type(directory_weapons, file_types={".txt": "Text"})
-    qdrant_create_collection(collection_name, size=3072)
+    # Points are keyed by file name, so only new or changed files are embedded
+    # and upserted; a fresh collection gets every file.
+    index = FileIndex(directory_weapons, "S03E02", file_types={".txt": "Text"})
+    if qdrant_create_collection(collection_name, size=3072):
+        index.reset()
+    weapon_files = index.scan()
+    contents = []
     for file_name in weapon_files["Text"]:
         with open(
             os.path.join(directory_weapons, file_name), "r", encoding="utf-8"
         ) as file:
-            content = file.read().strip()
-            embedding = openai_get_embedding(content, model="text-embedding-3-large")
-            unique_id = str(uuid.uuid4())
-            date = os.path.splitext(file_name)[0]
-            qdrant_upsert(
-                collection_name=collection_name,
-                unique_id=unique_id,
-                embedding=embedding,
-                payload={
-                    "file_name": file_name,
-                    "content": content,
-                    "date": date.replace("_", "-"),
-                },
-            )
+            contents.append(file.read().strip())
+    embeddings = openai_get_embeddings(contents, model="text-embedding-3-large")
+    for file_name, content, embedding in zip(
+        weapon_files["Text"], contents, embeddings
+    ):
+        date = os.path.splitext(os.path.basename(file_name))[0]
+        if not qdrant_upsert(
+            collection_name=collection_name,
+            unique_id=_point_id(file_name),
+            embedding=embedding.tolist(),
+            payload={
+                "file_name": file_name,
+                "content": content,
+                "date": date.replace("_", "-"),
+            },
+        ):
+            # Not recorded, so the next run upserts it again.
+            index.discard(file_name)
+    # Removed files drop out of the manifest on commit, so only commit once
+    # their points are gone; the next run then retries the whole change set.
+    if qdrant_delete(collection_name, [_point_id(name) for name in index.removed]):
+        index.commit()
+
     query_results = query_similar_text(
         query_text=question,
         collection_name=collection_name,
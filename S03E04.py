@@ -1,9 +1,9 @@
 import json
 import os
-import requests
 from loguru import logger
 from utils_ai import aidevs_send_answer, aidevs_s03e04_query, openai_create
 from utils_files_and_text import extract_answer
+from utils_http import http_client
 
 
 _operation_config = {
@@ -93,7 +93,7 @@ def run():
     - Use updated information effectively to progress logically and avoid redundant or looping questions.  
     - The final answer must confidently identify BARBARA's location.
     """
-    introduction_data_response = requests.get(url=os.getenv("S03E04_BARBARA_URL"))
+    introduction_data_response = http_client.get(url=os.getenv("S03E04_BARBARA_URL"))
     introduction_data: str = introduction_data_response.text
     human_template: str = f"{introduction_data}"
     for i in range(35):
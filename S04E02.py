@@ -3,7 +3,7 @@ import os
 from loguru import logger
 from typing import Any, Dict, List
 
-from utils_ai import aidevs_send_answer, openai_create
+from utils_ai import aidevs_send_answer, batch_create
 
 
 directory: str = "data/lab_data"
@@ -54,18 +54,23 @@ def run():
     input_file: str = "verify.txt"
     result_answers: List[str] = []
     with open(os.path.join(directory, input_file), "r") as file:
-        for line in file:
-            line = line.strip()
-            logger.debug(line)
-            human_template: str = f"{line.split('=')[1]}"
-            assistant_response: str = openai_create(
-                system_template,
-                human_template,
-                model=os.getenv("S04E02_MODEL"),
-            )
-            logger.debug(assistant_response.content)
-            if assistant_response.content == "correct":
-                result_answers.append(line.split("=")[0])
+        lines: List[str] = [line.strip() for line in file]
+    for line in lines:
+        logger.debug(line)
+    assistant_responses = batch_create(
+        [
+            {
+                "system_template": system_template,
+                "human_template": f"{line.split('=')[1]}",
+                "model": os.getenv("S04E02_MODEL"),
+            }
+            for line in lines
+        ]
+    )
+    for line, assistant_response in zip(lines, assistant_responses):
+        logger.debug(assistant_response.content)
+        if assistant_response.content == "correct":
+            result_answers.append(line.split("=")[0])
 
     logger.debug(result_answers)
 
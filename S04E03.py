@@ -1,53 +1,46 @@
 import os
-import requests
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 from loguru import logger
-from typing import Dict, Tuple, Optional
+from typing import Any, Dict, Tuple, Optional
 
-from utils_ai import aidevs_send_answer, openai_create
+from utils_ai import aidevs_send_answer, openai_answer_questions, openai_create
 from utils_files_and_text import check_if_error, extract_answer, extract_redirect
+from utils_hedging import DeadlineExceeded
+from utils_html import html_to_markdown
+from utils_http import http_client
 
 load_dotenv()
 
+# gpt-4o-mini answers these in a few seconds; past this, ask gpt-4o instead.
+MINI_DEADLINE_SECONDS: float = float(os.getenv("S04E03_MINI_DEADLINE_SECONDS", 30))
+
 
 def get_questions() -> Dict[str, str]:
-    response = requests.get(os.getenv("S04E03_QUESTIONS_URL"))
+    response = http_client.get(os.getenv("S04E03_QUESTIONS_URL"))
     return response.json()
 
 
 def clean_html_content(url: str) -> Tuple[str, Dict[str, str]]:
     """
-    Fetches HTML content from given URL and returns cleaned text and available links.
+    Fetches HTML content from given URL and returns it as Markdown, with
+    available links.
 
     Args:
         url (str): URL to fetch content from
 
     Returns:
         Tuple[str, Dict[str, str]]: Tuple containing:
-            - cleaned text content (str)
+            - Markdown content (str)
             - dictionary of links {link_text: href_url}
     """
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, "html.parser")
-
-    # Extract all links before cleaning
-    links = {}
-    for link in soup.find_all("a"):
-        link_text = link.get_text().strip()
-        href = link.get("href")
-        if link_text and href:  # Only store links that have both text and href
-            links[link_text] = href
-
-    # Remove script and style elements
-    for script in soup(["script", "style"]):
-        script.decompose()
-
-    # Get text and clean up whitespace
-    text = soup.get_text()
-    lines = (line.strip() for line in text.splitlines())
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-    text = " ".join(chunk for chunk in chunks if chunk)
+    response = http_client.get(url)
+    page: Dict[str, Any] = html_to_markdown(response.content, url)
+
+    # Only links that have both text and href
+    links: Dict[str, str] = {
+        link["text"]: link["href"] for link in page["links"] if link["text"]
+    }
+    text: str = page["markdown"]
 
     return text, links
 
@@ -193,6 +186,14 @@ def run() -> None:
     initial_webpage_content, initial_links = clean_html_content(base_url)
     logger.debug(f"Initial content: {initial_webpage_content}")
     logger.debug(f"Links: {initial_links}")
+    # All questions are first asked together against the start page, so its
+    # content is sent once; only questions that need other pages loop below.
+    initial_answers: Dict[str, str] = openai_answer_questions(
+        f"<CONTENT>{initial_webpage_content}</CONTENT>\n<HREF>{initial_links}</HREF>",
+        {key: f"<QUESTION>{value}</QUESTION>" for key, value in questions.items()},
+        system_template,
+        validate=lambda answer: extract_answer(answer) is not None,
+    )
     answers: Dict[str, str] = {key: "" for key in questions.keys()}
 
     for id_question, question in questions.items():
@@ -204,22 +205,35 @@ def run() -> None:
             <CONTENT>{webpage_content}</CONTENT>
             <HREF>{links}</HREF>
             """
-            full_answer = openai_create(
-                system_template, human_template, model="gpt-4o-mini"
-            )
+            timed_out: bool = False
+            if webpage_content is initial_webpage_content:
+                answer_content: str = initial_answers[id_question]
+            else:
+                # A stalled gpt-4o-mini call is escalated the same way as an
+                # <ERROR> answer instead of being waited out.
+                try:
+                    answer_content = openai_create(
+                        system_template,
+                        human_template,
+                        model="gpt-4o-mini",
+                        deadline_seconds=MINI_DEADLINE_SECONDS,
+                    ).content
+                except DeadlineExceeded:
+                    logger.warning(f"gpt-4o-mini timed out on {id_question}")
+                    answer_content, timed_out = "", True
             logger.debug(f"Question_id: {id_question} Question: {question}")
-            logger.debug(f"Answer: {full_answer.content}")
-            response_error: bool = check_if_error(full_answer.content)
-            if response_error:
-                full_answer = openai_create(
+            logger.debug(f"Answer: {answer_content}")
+            response_error: bool = check_if_error(answer_content)
+            if response_error or timed_out:
+                answer_content = openai_create(
                     system_template, human_template, model="gpt-4o"
-                )
+                ).content
                 logger.debug(f"Question_id: {id_question} Question: {question}")
-                logger.debug(f"Answer: {full_answer.content}")
+                logger.debug(f"Answer: {answer_content}")
 
-            response_answer: Optional[str] = extract_answer(full_answer.content)
-            response_error = check_if_error(full_answer.content)
-            response_redirect: Optional[str] = extract_redirect(full_answer.content)
+            response_answer: Optional[str] = extract_answer(answer_content)
+            response_error = check_if_error(answer_content)
+            response_redirect: Optional[str] = extract_redirect(answer_content)
             if response_redirect:
                 new_url: str = (
                     response_redirect
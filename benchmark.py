@@ -0,0 +1,593 @@
+"""
+End-to-end benchmark of episode pipelines against local stubs.
+
+Every stage runs S0xExx.run() in a fresh process inside its own workspace
+with a synthetic corpus. The process talks to an OpenAI-compatible stub
+server and a stub AI Devs endpoint. Qdrant runs in-process in memory and
+Neo4j is replaced by a small in-process graph. Each stage runs twice on the
+same workspace: "cold", then "warm" so the on-disk caches can pay off.
+
+    python benchmark.py --episodes S03E01,S03E02 --sizes 10,1000 --latency 0.05
+    python benchmark.py --html-sizes 100,1000,5000
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+_WORDS: List[str] = (
+    "raport patrol czujnik ruch zwierzyna fabryka sektor naprawa kondensator "
+    "silnik robot więzień odcisk telefon dokument kamera bateria przewód "
+    "nauczyciel Grudziądz broń test prototyp laboratorium energia zasilanie"
+).split()
+
+
+def _sentence(rng: random.Random, words: int = 60) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)) + "."
+
+
+class StubServer:
+    """
+    OpenAI-compatible chat/embeddings/images endpoints plus the AI Devs
+    report and database endpoints, each answering after `latency` seconds.
+    Requests are counted per path.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.graph_size: int = 10
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                length: int = int(self.headers.get("Content-Length", 0))
+                body: Dict[str, Any] = json.loads(self.rfile.read(length) or b"{}")
+                path: str = self.path.split("?")[0]
+                with stub._lock:
+                    stub.counts[path] += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                payload: Dict[str, Any] = stub.respond(path, body)
+                data: bytes = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        ThreadingHTTPServer.request_queue_size = 256
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url: str = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> "StubServer":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.counts)
+
+    def respond(self, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        if path.endswith("/chat/completions"):
+            return self._chat(body)
+        if path.endswith("/embeddings"):
+            return self._embeddings(body)
+        if path.endswith("/images/generations"):
+            return {"created": 0, "data": [{"url": f"{self.url}/image.png"}]}
+        if path == "/apidb":
+            return {
+                "reply": self._graph_rows(str(body.get("query", ""))),
+                "error": "OK",
+            }
+        return {"code": 0, "message": "OK"}
+
+    def _chat(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        response_format: Dict[str, Any] = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            properties = response_format["json_schema"]["schema"]["properties"]
+            content: str = json.dumps({key: "stub" for key in properties})
+        else:
+            content = "<ANSWER>people</ANSWER>"
+        prompt_tokens: int = len(json.dumps(body.get("messages", []))) // 4
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body.get("model", "stub"),
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": 8,
+                "total_tokens": prompt_tokens + 8,
+            },
+        }
+
+    def _embeddings(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = body.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        model: str = body.get("model", "text-embedding-3-small")
+        dimensions: int = body.get("dimensions") or (
+            3072 if model.endswith("large") else 1536
+        )
+        data: List[Dict[str, Any]] = []
+        for index, text in enumerate(inputs):
+            seed: int = int(hashlib.sha256(str(text).encode()).hexdigest()[:8], 16)
+            vector = np.random.default_rng(seed).standard_normal(dimensions)
+            vector = (vector / np.linalg.norm(vector)).astype(np.float32)
+            embedding: Any = (
+                base64.b64encode(vector.tobytes()).decode("ascii")
+                if body.get("encoding_format") == "base64"
+                else vector.tolist()
+            )
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens: int = sum(len(str(text)) // 4 for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": model,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def _graph_rows(self, query: str) -> List[Dict[str, str]]:
+        size: int = max(2, self.graph_size)
+        if "connections" in query:
+            rng = random.Random(size)
+            rows = [
+                {"user1_id": str(i), "user2_id": str(i + 1)} for i in range(1, size)
+            ]
+            rows += [
+                {
+                    "user1_id": str(rng.randint(1, size)),
+                    "user2_id": str(rng.randint(1, size)),
+                }
+                for _ in range(size)
+            ]
+            return rows
+        names: Dict[int, str] = {1: "Rafał", size: "Barbara"}
+        return [
+            {"id": str(i), "username": names.get(i, f"user{i}")}
+            for i in range(1, size + 1)
+        ]
+
+
+class _FakeGraphSession:
+    """
+    Understands the three queries in utils_neo4j: merge a person, merge a
+    CONNECTED_TO relationship, and an unweighted shortest path.
+    """
+
+    def __init__(self, graph: "_FakeGraphDriver"):
+        self.graph = graph
+
+    def __enter__(self) -> "_FakeGraphSession":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+    def write_transaction(self, function: Callable, *args: Any, **kwargs: Any) -> Any:
+        return function(self, *args, **kwargs)
+
+    read_transaction = execute_read = execute_write = write_transaction
+
+    def run(self, query: str, **params: Any) -> List[Dict[str, Any]]:
+        if "shortestPath" in query:
+            return self._shortest_path(params["start_name"], params["end_name"])
+        if "CONNECTED_TO" in query:
+            self.graph.edges.setdefault(params["id1"], set()).add(params["id2"])
+            self.graph.edges.setdefault(params["id2"], set()).add(params["id1"])
+        else:
+            self.graph.names[params["id"]] = params["name"]
+        return []
+
+    def _shortest_path(self, start_name: str, end_name: str) -> List[Dict[str, Any]]:
+        ids: Dict[str, str] = {name: id_ for id_, name in self.graph.names.items()}
+        start, end = ids.get(start_name), ids.get(end_name)
+        previous: Dict[str, Optional[str]] = {start: None}
+        queue: Deque[str] = deque([start])
+        while queue and end not in previous:
+            node = queue.popleft()
+            for neighbour in self.graph.edges.get(node, ()):
+                if neighbour not in previous:
+                    previous[neighbour] = node
+                    queue.append(neighbour)
+        if end not in previous:
+            return []
+        path: List[str] = []
+        node: Optional[str] = end
+        while node is not None:
+            path.append(node)
+            node = previous[node]
+        nodes = [{"name": self.graph.names[id_]} for id_ in reversed(path)]
+        return [{"path": SimpleNamespace(nodes=nodes)}]
+
+
+class _FakeGraphDriver:
+    def __init__(self):
+        self.names: Dict[str, str] = {}
+        self.edges: Dict[str, set] = {}
+
+    def session(self, **kwargs: Any) -> _FakeGraphSession:
+        return _FakeGraphSession(self)
+
+    def close(self) -> None:
+        pass
+
+
+def _write_texts(directory: str, names: List[str], rng: random.Random) -> None:
+    os.makedirs(directory, exist_ok=True)
+    for name in names:
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as file:
+            file.write(_sentence(rng))
+
+
+def _prepare_s02e04(workspace: str, size: int, rng: random.Random) -> Dict[str, str]:
+    _write_texts(
+        os.path.join(workspace, "data/pliki_z_fabryki"),
+        [f"report-{i:05d}.txt" for i in range(size)],
+        rng,
+    )
+    return {"S02E04_TASK_NAME": "kategorie"}
+
+
+def _prepare_s03e01(workspace: str, size: int, rng: random.Random) -> Dict[str, str]:
+    directory: str = os.path.join(workspace, "data/pliki_z_fabryki")
+    _write_texts(directory, [f"report-{i:05d}.txt" for i in range(size)], rng)
+    _write_texts(
+        os.path.join(directory, "facts"),
+        [f"f{i:04d}.txt" for i in range(max(1, size // 10))],
+        rng,
+    )
+    return {"S03E01_TASK_NAME": "dokumenty"}
+
+
+def _prepare_s03e02(workspace: str, size: int, rng: random.Random) -> Dict[str, str]:
+    first_day = date(2000, 1, 1)
+    _write_texts(
+        os.path.join(workspace, "data/pliki_z_fabryki/weapons_tests/do-not-share"),
+        [
+            f"{(first_day + timedelta(days=i)).strftime('%Y_%m_%d')}.txt"
+            for i in range(size)
+        ],
+        rng,
+    )
+    return {"S03E02_TASK_NAME": "wektory", "S03E02_TASK_QUESTION": _sentence(rng, 10)}
+
+
+def _prepare_s03e05(workspace: str, size: int, rng: random.Random) -> Dict[str, str]:
+    return {"S03E05_TASK_NAME": "connections", "S03E03_TASK_NAME": "database"}
+
+
+def _prepare_s04e02(workspace: str, size: int, rng: random.Random) -> Dict[str, str]:
+    directory: str = os.path.join(workspace, "data/lab_data")
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "verify.txt"), "w", encoding="utf-8") as file:
+        for i in range(size):
+            file.write(
+                f"{i:05d}={','.join(str(rng.randint(-99, 99)) for _ in range(4))}\n"
+            )
+    return {"S04E02_TASK_NAME": "research", "S04E02_MODEL": "gpt-4o-mini"}
+
+
+EPISODES: Dict[str, Callable[[str, int, random.Random], Dict[str, str]]] = {
+    "S02E04": _prepare_s02e04,
+    "S03E01": _prepare_s03e01,
+    "S03E02": _prepare_s03e02,
+    "S03E05": _prepare_s03e05,
+    "S04E02": _prepare_s04e02,
+}
+
+
+def _run_stage(episode: str, workspace: str, env: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Runs one episode in this (fresh) process and reports its own wall time,
+    peak RSS and LLM call counters.
+    """
+    os.environ.update(env)
+    os.chdir(workspace)
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    from qdrant_client import QdrantClient
+
+    import utils_neo4j
+    import utils_qdrant
+    from utils_metrics import llm_metrics
+
+    utils_qdrant.client = QdrantClient(location=":memory:")
+    utils_neo4j.create_driver = _FakeGraphDriver
+    module = __import__(episode)
+    error: Optional[str] = None
+    start: float = time.perf_counter()
+    try:
+        module.run()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    seconds: float = time.perf_counter() - start
+    metrics = llm_metrics.to_json().values()
+    return {
+        "seconds": seconds,
+        # ru_maxrss is in kilobytes on Linux.
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "llm_calls": sum(entry["calls"] for entry in metrics),
+        "cache_hits": sum(entry["cache_hits"] for entry in metrics),
+        "error": error,
+    }
+
+
+def _stage_env(stub: StubServer, use_caches: bool) -> Dict[str, str]:
+    env: Dict[str, str] = {
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"{stub.url}/v1",
+        "AIDEVS3_API_KEY": "stub",
+        "AIDEVS3_API_URL": f"{stub.url}/report",
+        "S03E03_API_URL": f"{stub.url}/apidb",
+        "OPENAI_RATE_LIMITS": "",
+        "REPLAY_MODE": "",
+    }
+    if use_caches:
+        env["LLM_CACHE_PATH"] = ".cache/llm_cache.sqlite"
+    else:
+        env.update(
+            LLM_CACHE_PATH="",
+            VISION_CACHE_PATH="",
+            EMBEDDING_CACHE_DIR="",
+            WHISPER_CACHE_PATH="",
+            DOWNLOAD_CACHE_PATH="",
+            FILE_INDEX_PATH="",
+        )
+    return env
+
+
+def run_benchmark(
+    episodes: List[str],
+    sizes: List[int],
+    latency: float,
+    runs: Tuple[str, ...] = ("cold", "warm"),
+    use_caches: bool = True,
+    keep_workspaces: bool = False,
+) -> List[Dict[str, Any]]:
+    stub = StubServer(latency).start()
+    context = multiprocessing.get_context("spawn")
+    results: List[Dict[str, Any]] = []
+    try:
+        for episode in episodes:
+            for size in sizes:
+                workspace: str = tempfile.mkdtemp(prefix=f"bench-{episode}-{size}-")
+                env: Dict[str, str] = {
+                    **_stage_env(stub, use_caches),
+                    **EPISODES[episode](workspace, size, random.Random(size)),
+                }
+                stub.graph_size = size
+                for run in runs:
+                    before: Counter = stub.snapshot()
+                    with ProcessPoolExecutor(1, mp_context=context) as executor:
+                        stage = executor.submit(
+                            _run_stage, episode, workspace, env
+                        ).result()
+                    requests = stub.snapshot() - before
+                    results.append(
+                        {
+                            "episode": episode,
+                            "size": size,
+                            "run": run,
+                            **stage,
+                            "requests": dict(requests),
+                        }
+                    )
+                    _print_row(results[-1])
+                if not keep_workspaces:
+                    shutil.rmtree(workspace, ignore_errors=True)
+    finally:
+        stub.stop()
+    return results
+
+
+def _print_row(result: Dict[str, Any]) -> None:
+    requests: str = " ".join(
+        f"{path.rsplit('/', 1)[-1]}={count}"
+        for path, count in sorted(result["requests"].items())
+    )
+    print(
+        f"{result['episode']:<8} {result['size']:>6} {result['run']:<5} "
+        f"{result['seconds']:>8.2f}s {result['peak_rss_mb']:>8.1f}MB "
+        f"calls={result['llm_calls']} hits={result['cache_hits']} {requests}"
+        + (f" ERROR {result['error']}" if result["error"] else ""),
+        flush=True,
+    )
+
+
+def check_import_times(budget_seconds: float) -> Dict[str, float]:
+    """
+    Imports every utils_* and episode module in a fresh interpreter and
+    returns the seconds each took. Modules over `budget_seconds` are printed
+    as failures; heavy dependencies should only load on first use.
+    """
+    repo: str = os.path.dirname(os.path.abspath(__file__))
+    modules: List[str] = sorted(
+        name[:-3]
+        for name in os.listdir(repo)
+        if name.endswith(".py") and (name.startswith("utils_") or name[:2] == "S0")
+    )
+    times: Dict[str, float] = {}
+    for module in modules:
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import time; start = time.perf_counter(); "
+                f"import {module}; print(time.perf_counter() - start)",
+            ],
+            cwd=repo,
+            capture_output=True,
+            text=True,
+        )
+        if output.returncode != 0:
+            print(
+                f"{module:<24} import failed: {output.stderr.strip().splitlines()[-1]}"
+            )
+            continue
+        times[module] = float(output.stdout.strip().splitlines()[-1])
+        status: str = "OK" if times[module] <= budget_seconds else "OVER BUDGET"
+        print(f"{module:<24} {times[module]:>7.3f}s {status}")
+    return times
+
+
+def _synthetic_page(sections: int, rng: random.Random) -> str:
+    parts: List[str] = [
+        "<html><head><title>Bench</title><style>p{}</style></head><body>"
+    ]
+    for index in range(sections):
+        parts.append(
+            f"<div class='section'><h2>Sekcja {index}</h2>"
+            f"<p>{_sentence(rng)} <b>{_sentence(rng, 3)}</b> "
+            f"<a href='/page/{index}'>{_sentence(rng, 2)}</a></p>"
+            f"<ul><li>{_sentence(rng, 8)}</li><li>{_sentence(rng, 8)}</li></ul>"
+            f"<table><tr><th>a</th><th>b</th></tr><tr><td>{index}</td>"
+            f"<td>{_sentence(rng, 4)}</td></tr></table>"
+            f"<img src='img/{index}.png' alt='x'><script>var x = {index};</script>"
+            "</div>"
+        )
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def _soup_text(html: str) -> Tuple[str, Dict[str, str]]:
+    # The BeautifulSoup/get_text() conversion html_to_markdown replaced.
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    links: Dict[str, str] = {}
+    for link in soup.find_all("a"):
+        link_text = link.get_text().strip()
+        href = link.get("href")
+        if link_text and href:
+            links[link_text] = href
+    for script in soup(["script", "style"]):
+        script.decompose()
+    text = soup.get_text()
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return " ".join(chunk for chunk in chunks if chunk), links
+
+
+def benchmark_html_conversion(
+    sizes: List[int], repeats: int = 3
+) -> List[Dict[str, Any]]:
+    """
+    Times html_to_markdown against the previous BeautifulSoup text extraction
+    on synthetic pages of `sizes` sections (about 1 KB each), best of
+    `repeats`.
+    """
+    from utils_html import html_to_markdown
+
+    results: List[Dict[str, Any]] = []
+    print(f"{'sections':>8} {'bytes':>10} {'soup':>9} {'lxml':>9} {'speedup':>8}")
+    for size in sizes:
+        html: str = _synthetic_page(size, random.Random(size))
+        timings: Dict[str, float] = {}
+        for name, convert in (
+            ("soup", _soup_text),
+            ("lxml", lambda page: html_to_markdown(page, "http://bench/")),
+        ):
+            best: float = float("inf")
+            for _ in range(repeats):
+                start: float = time.perf_counter()
+                convert(html)
+                best = min(best, time.perf_counter() - start)
+            timings[name] = best
+        results.append({"sections": size, "bytes": len(html), **timings})
+        print(
+            f"{size:>8} {len(html):>10} {timings['soup']:>8.3f}s "
+            f"{timings['lxml']:>8.3f}s {timings['soup'] / timings['lxml']:>7.1f}x",
+            flush=True,
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--episodes", default=",".join(EPISODES))
+    parser.add_argument("--sizes", default="10,1000")
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds per stub request"
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Disable all caches")
+    parser.add_argument("--keep-workspaces", action="store_true")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument(
+        "--import-budget",
+        type=float,
+        help="Only check that every module imports within this many seconds",
+    )
+    parser.add_argument(
+        "--html-sizes",
+        help="Only benchmark HTML conversion on pages of these section counts",
+    )
+    args = parser.parse_args()
+
+    if args.import_budget is not None:
+        times = check_import_times(args.import_budget)
+        sys.exit(int(any(t > args.import_budget for t in times.values())))
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if args.html_sizes:
+        results = benchmark_html_conversion(
+            [int(size) for size in args.html_sizes.split(",")]
+        )
+    else:
+        print(f"{'episode':<8} {'size':>6} {'run':<5} {'wall':>9} {'peak rss':>10}")
+        results = run_benchmark(
+            args.episodes.split(","),
+            [int(size) for size in args.sizes.split(",")],
+            args.latency,
+            use_caches=not args.no_cache,
+            keep_workspaces=args.keep_workspaces,
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
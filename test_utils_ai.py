@@ -0,0 +1,57 @@
+import pytest
+from contextlib import closing
+
+import utils_ai
+from benchmark import StubServer
+from utils_hedging import CallPolicy
+from utils_ratelimit import RateLimiter
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = StubServer(latency=0.0).start()
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{server.url}/v1")
+    monkeypatch.setattr(utils_ai.llm_cache, "get", lambda: None)
+    monkeypatch.setattr(utils_ai.embedding_cache, "get", lambda: None)
+    monkeypatch.setattr(utils_ai, "rate_limiter", None)
+    yield server
+    server.stop()
+
+
+def test_batch_create_twice_in_one_process(stub):
+    # Each batch_create runs its own event loop; the second must not reuse
+    # connections bound to the first, closed one.
+    for prompt in ("first", "second"):
+        responses = utils_ai.batch_create(
+            [{"system_template": "s", "human_template": prompt}]
+        )
+        assert responses[0].content == "<ANSWER>people</ANSWER>"
+
+
+def test_embeddings_then_batch_create(stub):
+    assert utils_ai.openai_get_embeddings(["a", "b"]).shape[0] == 2
+    responses = utils_ai.batch_create([{"system_template": "s", "human_template": "h"}])
+    assert responses[0].content == "<ANSWER>people</ANSWER>"
+
+
+def test_failed_attempts_are_refunded(stub, monkeypatch, tmp_path):
+    limiter = RateLimiter(
+        str(tmp_path / "limits.sqlite"), {"gpt-4o-mini": {"tpm": 1e6}}
+    )
+    monkeypatch.setattr(utils_ai, "rate_limiter", limiter)
+    monkeypatch.setattr(utils_ai, "count_message_tokens", lambda *args: 1000)
+    attempts = []
+
+    def _failing(**kwargs):
+        attempts.append(kwargs)
+        raise ConnectionError("reset")
+
+    monkeypatch.setattr(utils_ai, "_create_chat_completion", _failing)
+    policy = CallPolicy(max_retries=2, backoff_base=0.0)
+    with pytest.raises(ConnectionError):
+        utils_ai._chat_completion("gpt-4o-mini", [], policy)
+    assert len(attempts) == 3
+    with closing(limiter._connect()) as conn:
+        (tokens,) = conn.execute("SELECT tokens FROM buckets").fetchone()
+    assert tokens == pytest.approx(1e6, rel=1e-3)
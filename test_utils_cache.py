@@ -0,0 +1,17 @@
+from utils_cache import SqliteCache
+
+
+def test_max_entries_holds_after_every_write(tmp_path):
+    cache = SqliteCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    for index in range(70):
+        cache.set(f"key-{index}", index)
+        assert cache.stats()["entries"] <= 2
+    assert cache.get("key-69") == 69
+    assert cache.get("key-0") is None
+
+
+def test_max_bytes_holds_after_every_write(tmp_path):
+    cache = SqliteCache(str(tmp_path / "cache.sqlite"), max_bytes=1000)
+    for index in range(20):
+        cache.set(f"key-{index}", b"x" * 300)
+        assert cache.stats()["bytes"] <= 1000
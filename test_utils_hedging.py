@@ -0,0 +1,34 @@
+import time
+
+import pytest
+
+from utils_hedging import CallPolicy, DeadlineExceeded, call_with_policy
+
+
+def test_deadline_without_hedging_interrupts_the_wait():
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        call_with_policy(
+            "slow",
+            lambda timeout: time.sleep(2) or "x",
+            CallPolicy(deadline_seconds=0.5),
+        )
+    assert time.monotonic() - start < 1.5
+
+
+def test_nested_call_past_its_deadline_raises():
+    def _outer(timeout):
+        return call_with_policy(
+            "inner",
+            lambda inner_timeout: time.sleep(0.3) or "x",
+            CallPolicy(deadline_seconds=0.1),
+        )
+
+    with pytest.raises(DeadlineExceeded):
+        call_with_policy("outer", _outer, CallPolicy(deadline_seconds=5, max_retries=0))
+
+
+def test_call_within_deadline_returns_its_result():
+    assert call_with_policy(
+        "fast", lambda timeout: timeout > 0, CallPolicy(deadline_seconds=5)
+    )
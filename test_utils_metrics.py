@@ -0,0 +1,24 @@
+from utils_metrics import llm_metrics, metered, record_usage
+
+
+@metered("test_inner")
+def _inner(model: str) -> str:
+    record_usage(10, 5)
+    return "x"
+
+
+@metered("test_outer")
+def _outer(model: str) -> str:
+    return _inner(model)
+
+
+def test_nested_metered_calls_count_once():
+    llm_metrics.reset()
+    _outer("m")
+    metrics = llm_metrics.to_json()
+    assert metrics["test_inner|m"]["calls"] == 1
+    assert metrics["test_inner|m"]["prompt_tokens"] == 10
+    assert metrics["test_outer|m"]["calls"] == 0
+    assert metrics["test_outer|m"]["cache_hits"] == 0
+    assert metrics["test_outer|m"]["duration_seconds"]["count"] == 1
+    assert sum(entry["calls"] for entry in metrics.values()) == 1
@@ -0,0 +1,24 @@
+import pytest
+
+from utils_ratelimit import RateLimiter
+
+
+def test_tpm_only_limit_throttles(tmp_path):
+    limiter = RateLimiter(str(tmp_path / "limits.sqlite"), {"m": {"tpm": 60}})
+    assert limiter._try_acquire("m", 30) == 0.0
+    assert limiter._try_acquire("m", 30) == 0.0
+    # The bucket is empty and refills at one token per second.
+    assert limiter._try_acquire("m", 30) == pytest.approx(30, abs=1)
+
+
+def test_rpm_only_limit_throttles(tmp_path):
+    limiter = RateLimiter(str(tmp_path / "limits.sqlite"), {"m": {"rpm": 2}})
+    assert limiter._try_acquire("m", 1000) == 0.0
+    assert limiter._try_acquire("m", 1000) == 0.0
+    assert limiter._try_acquire("m", 1000) == pytest.approx(30, abs=1)
+
+
+def test_unlimited_model_is_not_throttled(tmp_path):
+    limiter = RateLimiter(str(tmp_path / "limits.sqlite"), {"m": {"tpm": 60}})
+    for _ in range(5):
+        assert limiter._try_acquire("other", 10_000) == 0.0
@@ -1,63 +1,629 @@
+import asyncio
 import base64
+import functools
+import json
+import numpy as np
 import os
 import requests
-import whisper
+import threading
+import time
 from dotenv import load_dotenv
+from loguru import logger
 
-# from openai import OpenAI
-from langfuse.openai import OpenAI
-from langfuse.decorators import observe
-from openai.types import ImagesResponse
-from typing import Any, Dict, List, Literal, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Union,
+)
+
+from utils_cache import (
+    EmbeddingCache,
+    LazyCache,
+    SqliteCache,
+    hash_bytes,
+    make_cache_key,
+)
+from utils_hedging import CallPolicy, acall_with_policy, call_with_policy
+from utils_http import HttpClient, http_client
+from utils_images import detect_image_mime, preprocess_image
+from utils_metrics import metered, record_error, record_ttfb, record_usage
+from utils_ratelimit import RateLimiter, rate_limiter_from_env
+from utils_replay import replayable
+from utils_tokens import count_message_tokens, count_tokens
+from utils_whisper import whisper_transcribe  # noqa: F401
+
+if TYPE_CHECKING:
+    from langfuse.openai import AsyncOpenAI, OpenAI
+    from openai.types import ImagesResponse
 
 
 load_dotenv()
-client = OpenAI()
-client.api_key = os.getenv("OPENAI_API_KEY")
+# The OpenAI SDK and Langfuse take over a second to import, so both are only
+# loaded when the first request is made. Assign these to inject other clients.
+client: Optional["OpenAI"] = None
+async_client: Optional["AsyncOpenAI"] = None
+# Pooled connections of an async client are bound to the event loop they were
+# opened on, and batch_create/openai_get_embeddings run a new loop each time,
+# so without an injected async_client there is one client per running loop.
+_loop_async_clients: Dict[asyncio.AbstractEventLoop, "AsyncOpenAI"] = {}
+_loop_async_clients_lock = threading.Lock()
 
 
-def generate_local_llm_response(
+def _openai_client() -> "OpenAI":
+    global client
+    if client is None:
+        # from openai import OpenAI
+        from langfuse.openai import OpenAI
+
+        # Retries are done by llm_call_policy, which also enforces deadlines.
+        client = OpenAI(max_retries=0)
+        client.api_key = os.getenv("OPENAI_API_KEY")
+    return client
+
+
+def _openai_async_client() -> "AsyncOpenAI":
+    if async_client is not None:
+        return async_client
+    loop = asyncio.get_running_loop()
+    with _loop_async_clients_lock:
+        loop_client = _loop_async_clients.get(loop)
+        if loop_client is None:
+            from langfuse.openai import AsyncOpenAI
+
+            # Clients of finished loops cannot be closed or reused; drop them.
+            for closed_loop in [
+                finished for finished in _loop_async_clients if finished.is_closed()
+            ]:
+                del _loop_async_clients[closed_loop]
+            loop_client = AsyncOpenAI(max_retries=0)
+            loop_client.api_key = os.getenv("OPENAI_API_KEY")
+            _loop_async_clients[loop] = loop_client
+    return loop_client
+
+
+def observe(name: str) -> Callable:
+    """
+    Langfuse's @observe, applied on the first call instead of at import time.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        observed: List[Callable] = []
+
+        def _observed() -> Callable:
+            if not observed:
+                from langfuse.decorators import observe as langfuse_observe
+
+                observed.append(langfuse_observe(name=name)(function))
+            return observed[0]
+
+        if asyncio.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                return await _observed()(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            return _observed()(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _open_llm_cache(
+    path: str,
+    max_entries: Optional[int] = 10_000,
+    max_bytes: Optional[int] = 512 * 1024 * 1024,
+    max_age_seconds: Optional[float] = 30 * 24 * 3600,
+) -> SqliteCache:
+    return SqliteCache(
+        path,
+        namespace="llm",
+        max_entries=max_entries,
+        max_bytes=max_bytes,
+        max_age_seconds=max_age_seconds,
+    )
+
+
+# Off unless LLM_CACHE_PATH is set.
+llm_cache: LazyCache[SqliteCache] = LazyCache("LLM_CACHE_PATH", None, _open_llm_cache)
+
+
+def enable_llm_cache(
+    path: str = ".cache/llm_cache.sqlite",
+    max_entries: Optional[int] = 10_000,
+    max_bytes: Optional[int] = 512 * 1024 * 1024,
+    max_age_seconds: Optional[float] = 30 * 24 * 3600,
+) -> SqliteCache:
+    """
+    Turns on the persistent LLM response cache for this process.
+    Setting LLM_CACHE_PATH in the environment does the same on first use.
+    Returns:
+        SqliteCache: The active cache, whose stats() reports hit/miss counters.
+    """
+    return llm_cache.set(_open_llm_cache(path, max_entries, max_bytes, max_age_seconds))
+
+
+def disable_llm_cache() -> None:
+    llm_cache.set(None)
+
+
+def _open_vision_cache(path: str) -> SqliteCache:
+    return SqliteCache(path, namespace="vision", max_entries=50_000, memory_entries=256)
+
+
+# Image analyses are re-run on every episode run and repair iteration, so this
+# cache is on unless VISION_CACHE_PATH is set to an empty string.
+vision_cache: LazyCache[SqliteCache] = LazyCache(
+    "VISION_CACHE_PATH", ".cache/vision_cache.sqlite", _open_vision_cache
+)
+
+
+def enable_vision_cache(path: str = ".cache/vision_cache.sqlite") -> SqliteCache:
+    """
+    Turns on the cache of vision results, keyed by image content hashes,
+    templates, model and temperature. Recent results are also held in memory.
+    """
+    return vision_cache.set(_open_vision_cache(path))
+
+
+def disable_vision_cache() -> None:
+    vision_cache.set(None)
+
+
+def _cached_call(
+    key_parts: List[Any],
+    compute: Callable[[], Any],
+    cache: Optional[SqliteCache] = None,
+) -> Any:
+    cache = cache or llm_cache.get()
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(make_cache_key(*key_parts), compute)
+
+
+async def _cached_acall(
+    key_parts: List[Any],
+    compute: Callable[[], Any],
+    cache: Optional[SqliteCache] = None,
+) -> Any:
+    cache = cache or llm_cache.get()
+    if cache is None:
+        return await compute()
+    key: str = make_cache_key(*key_parts)
+    value = cache.get(key)
+    if value is None:
+        value = await compute()
+        cache.set(key, value)
+    return value
+
+
+class LocalLLMError(Exception):
+    pass
+
+
+# Local generation can take minutes, but a stopped Ollama should fail fast.
+ollama_client = HttpClient(timeout=(2.0, 600.0), max_retries=1)
+OLLAMA_KEEP_ALIVE: Optional[str] = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+
+def _ollama_request_options(timeout: Optional[float]) -> Dict[str, Any]:
+    # A caller with its own budget gets it as the read timeout and no retry,
+    # so a hung Ollama fails within the budget instead of after minutes.
+    if timeout is None:
+        return {}
+    connect_timeout: float = ollama_client.timeout[0]
+    return {"timeout": (min(connect_timeout, timeout), timeout), "max_retries": 0}
+
+
+def _local_llm_payload(
     system_template: str,
     human_template: str,
-    model: str = "llama2:7b",
-    stream: bool = False,
-    response_format: str = "json",
-    api_url: str = "http://localhost:11434/api/generate",
-) -> str:
-    payload = {
+    model: str,
+    stream: bool,
+    response_format: str,
+    keep_alive: Optional[str],
+    num_ctx: Optional[int],
+    options: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
         "model": model,
         "prompt": human_template,
         "stream": stream,
         "format": response_format,
         "system": system_template,
     }
+    model_options: Dict[str, Any] = dict(options or {})
+    if num_ctx is not None:
+        model_options["num_ctx"] = num_ctx
+    if model_options:
+        payload["options"] = model_options
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    return payload
+
+
+def _log_local_llm_timing(
+    model: str, result: Dict[str, Any], first_token_seconds: float, seconds: float
+) -> None:
+    eval_count: int = result.get("eval_count", 0)
+    eval_seconds: float = result.get("eval_duration", 0) / 1e9
+    tokens_per_second: float = eval_count / eval_seconds if eval_seconds else 0.0
+    logger.debug(
+        f"Ollama {model}: first token after {first_token_seconds:.2f}s, "
+        f"{eval_count} tokens at {tokens_per_second:.1f} tokens/s, {seconds:.2f}s total"
+    )
+
+
+@metered("generate_local_llm_stream")
+def generate_local_llm_stream(
+    system_template: str,
+    human_template: str,
+    model: str = "llama2:7b",
+    response_format: str = "json",
+    api_url: str = "http://localhost:11434/api/generate",
+    keep_alive: Optional[str] = OLLAMA_KEEP_ALIVE,
+    num_ctx: Optional[int] = None,
+    options: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+) -> Iterator[str]:
+    """
+    Streams a local Ollama completion, yielding response fragments as they arrive.
+    Args:
+        keep_alive (Optional[str]): How long Ollama keeps the model loaded after the
+            call (e.g. "30m", "-1" for forever). Defaults to OLLAMA_KEEP_ALIVE.
+        num_ctx (Optional[int]): Context window size, merged into `options`.
+        options (Optional[Dict[str, Any]]): Ollama model options (temperature, ...).
+        timeout (Optional[float]): Seconds to wait for each read, without
+            retrying; defaults to the client's timeouts and retry.
+    Raises:
+        LocalLLMError: If the request fails or Ollama reports an error.
+    """
+    payload = _local_llm_payload(
+        system_template,
+        human_template,
+        model,
+        True,
+        response_format,
+        keep_alive,
+        num_ctx,
+        options,
+    )
+    start: float = time.perf_counter()
+    first_token_seconds: Optional[float] = None
     try:
-        response = requests.post(api_url, json=payload)
-        response.raise_for_status()
+        with ollama_client.post(
+            api_url, json=payload, stream=True, **_ollama_request_options(timeout)
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk: Dict[str, Any] = json.loads(line)
+                if "error" in chunk:
+                    raise LocalLLMError(chunk["error"])
+                token: str = chunk.get("response", "")
+                if token:
+                    if first_token_seconds is None:
+                        first_token_seconds = time.perf_counter() - start
+                    yield token
+                if chunk.get("done"):
+                    record_usage(
+                        chunk.get("prompt_eval_count", 0), chunk.get("eval_count", 0)
+                    )
+                    _log_local_llm_timing(
+                        model,
+                        chunk,
+                        first_token_seconds or 0.0,
+                        time.perf_counter() - start,
+                    )
+    except requests.exceptions.RequestException as e:
+        raise LocalLLMError(str(e)) from e
+
+
+@metered("generate_local_llm_response")
+def generate_local_llm_response(
+    system_template: str,
+    human_template: str,
+    model: str = "llama2:7b",
+    stream: bool = False,
+    response_format: str = "json",
+    api_url: str = "http://localhost:11434/api/generate",
+    keep_alive: Optional[str] = OLLAMA_KEEP_ALIVE,
+    num_ctx: Optional[int] = None,
+    options: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+) -> str:
+    payload = _local_llm_payload(
+        system_template,
+        human_template,
+        model,
+        stream,
+        response_format,
+        keep_alive,
+        num_ctx,
+        options,
+    )
+
+    def _post() -> str:
+        if stream:
+            return "".join(
+                generate_local_llm_stream(
+                    system_template,
+                    human_template,
+                    model,
+                    response_format,
+                    api_url,
+                    keep_alive,
+                    num_ctx,
+                    options,
+                    timeout,
+                )
+            )
+        start: float = time.perf_counter()
+        try:
+            response = ollama_client.post(
+                api_url, json=payload, **_ollama_request_options(timeout)
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise LocalLLMError(str(e)) from e
         result = response.json()
+        # Without streaming the first token is only visible server-side.
+        server_first_token: float = (
+            result.get("load_duration", 0) + result.get("prompt_eval_duration", 0)
+        ) / 1e9
+        record_ttfb(server_first_token)
+        record_usage(result.get("prompt_eval_count", 0), result.get("eval_count", 0))
+        _log_local_llm_timing(
+            model, result, server_first_token, time.perf_counter() - start
+        )
         return result.get("response", result)
-    except requests.exceptions.RequestException as e:
+
+    cache_payload: Dict[str, Any] = {
+        key: value
+        for key, value in payload.items()
+        if key not in ("stream", "keep_alive")
+    }
+    try:
+        return _cached_call(["ollama", api_url, cache_payload], _post)
+    except LocalLLMError as e:
+        record_error()
         return f"error: {str(e)}"
 
 
+def _chat_messages(
+    system_template: str, human_content: Union[str, List[Dict[str, Any]]]
+) -> List[Dict[str, Any]]:
+    return [
+        {"role": "system", "content": system_template},
+        {"role": "user", "content": human_content},
+    ]
+
+
+def _vision_content(
+    human_template: str,
+    images_data: List[bytes],
+    preprocess_options: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    content = [{"type": "text", "text": human_template}]
+    for image_data in images_data:
+        image_url: Dict[str, str] = {}
+        if preprocess_options is not None:
+            prepared = preprocess_image(image_data, **preprocess_options)
+            image_data, mime_type = prepared["data"], prepared["mime_type"]
+            image_url["detail"] = prepared["detail"]
+        else:
+            mime_type = detect_image_mime(image_data)
+        encoded_image = base64.b64encode(image_data).decode("utf-8")
+        image_url["url"] = f"data:{mime_type};base64,{encoded_image}"
+        content.append({"type": "image_url", "image_url": image_url})
+    return content
+
+
+def _chat_cache_key(
+    model: str,
+    system_template: str,
+    human_template: str,
+    temperature: Optional[float] = None,
+    images_data: Optional[List[bytes]] = None,
+    preprocess_options: Optional[Dict[str, Any]] = None,
+) -> List[Any]:
+    key_parts: List[Any] = [
+        "openai_chat",
+        model,
+        system_template,
+        human_template,
+        temperature,
+        [hash_bytes(image_data) for image_data in images_data or []],
+    ]
+    if preprocess_options is not None:
+        key_parts.append(preprocess_options)
+    return key_parts
+
+
+rate_limiter: Optional[RateLimiter] = rate_limiter_from_env()
+# Completion tokens count towards TPM too; reserve this many up front and
+# settle the difference once the response reports real usage.
+COMPLETION_TOKENS_ESTIMATE: int = 512
+
+# Deadline and retries for every OpenAI request. LLM_DEADLINE_SECONDS=0 waits
+# indefinitely; LLM_HEDGE=1 sends a duplicate chat request once the first one
+# is slower than the model's recent p95 (or LLM_HEDGE_AFTER_SECONDS before
+# enough calls have been seen). Callers can override per call.
+llm_call_policy = CallPolicy(
+    deadline_seconds=float(os.getenv("LLM_DEADLINE_SECONDS", 120)) or None,
+    hedge=os.getenv("LLM_HEDGE", "") not in ("", "0"),
+    hedge_after_seconds=float(os.getenv("LLM_HEDGE_AFTER_SECONDS", 0)) or None,
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", 3)),
+)
+# Embedding requests are cheap to retry but not worth duplicating.
+embedding_call_policy = llm_call_policy.replace(hedge=False)
+
+
+# Thin wrappers around the SDK calls so record/replay sees every request that
+# leaves the process, whichever entry point made it.
+@replayable("openai.chat.completions", ignore=("timeout",))
+def _create_chat_completion(timeout: Optional[float] = None, **kwargs: Any) -> Any:
+    from openai import NOT_GIVEN
+
+    return _openai_client().chat.completions.create(
+        timeout=timeout or NOT_GIVEN, **kwargs
+    )
+
+
+@replayable("openai.chat.completions", ignore=("timeout",))
+async def _acreate_chat_completion(
+    timeout: Optional[float] = None, **kwargs: Any
+) -> Any:
+    from openai import NOT_GIVEN
+
+    return await _openai_async_client().chat.completions.create(
+        timeout=timeout or NOT_GIVEN, **kwargs
+    )
+
+
+@replayable("openai.embeddings", ignore=("timeout",))
+def _create_embeddings(
+    dimensions: Optional[int] = None, timeout: Optional[float] = None, **kwargs: Any
+) -> Any:
+    from openai import NOT_GIVEN
+
+    return _openai_client().embeddings.create(
+        dimensions=dimensions or NOT_GIVEN, timeout=timeout or NOT_GIVEN, **kwargs
+    )
+
+
+@replayable("openai.embeddings", ignore=("timeout",))
+async def _acreate_embeddings(
+    dimensions: Optional[int] = None, timeout: Optional[float] = None, **kwargs: Any
+) -> Any:
+    from openai import NOT_GIVEN
+
+    return await _openai_async_client().embeddings.create(
+        dimensions=dimensions or NOT_GIVEN, timeout=timeout or NOT_GIVEN, **kwargs
+    )
+
+
+@replayable("openai.images")
+def _generate_images(**kwargs: Any) -> Any:
+    return _openai_client().images.generate(**kwargs)
+
+
+def _record_chat_usage(response: Any) -> None:
+    usage = response.usage
+    if usage is None:
+        record_usage()
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    record_usage(
+        usage.prompt_tokens,
+        usage.completion_tokens,
+        getattr(details, "cached_tokens", 0) or 0,
+    )
+
+
+def _estimated_tokens(model: str, messages: List[Dict[str, Any]]) -> int:
+    if rate_limiter is None:
+        return 0
+    return count_message_tokens(messages, model) + COMPLETION_TOKENS_ESTIMATE
+
+
+def _settle(model: str, estimated_tokens: int, response: Any) -> Any:
+    if rate_limiter is not None and response.usage is not None:
+        rate_limiter.adjust(model, estimated_tokens, response.usage.total_tokens)
+    return response
+
+
+def _refund(model: str, estimated_tokens: int) -> None:
+    if rate_limiter is not None:
+        rate_limiter.adjust(model, estimated_tokens, 0)
+
+
+# The limiter is charged per attempt, since retries and hedged duplicates are
+# requests of their own; an attempt that fails or is cancelled is refunded.
+def _chat_completion(
+    model: str,
+    messages: List[Dict[str, Any]],
+    policy: Optional[CallPolicy] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    estimated_tokens: int = _estimated_tokens(model, messages)
+
+    def _attempt(timeout: Optional[float]) -> Any:
+        if rate_limiter is not None:
+            rate_limiter.acquire(model, estimated_tokens)
+        try:
+            response = _create_chat_completion(
+                model=model, messages=messages, timeout=timeout, **kwargs
+            )
+        except BaseException:
+            _refund(model, estimated_tokens)
+            raise
+        return _settle(model, estimated_tokens, response)
+
+    response = call_with_policy(model, _attempt, policy or llm_call_policy)
+    _record_chat_usage(response)
+    return response
+
+
+async def _achat_completion(
+    model: str,
+    messages: List[Dict[str, Any]],
+    policy: Optional[CallPolicy] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    estimated_tokens: int = _estimated_tokens(model, messages)
+
+    async def _attempt(timeout: Optional[float]) -> Any:
+        if rate_limiter is not None:
+            await rate_limiter.aacquire(model, estimated_tokens)
+        try:
+            response = await _acreate_chat_completion(
+                model=model, messages=messages, timeout=timeout, **kwargs
+            )
+        except BaseException:
+            _refund(model, estimated_tokens)
+            raise
+        return _settle(model, estimated_tokens, response)
+
+    response = await acall_with_policy(model, _attempt, policy or llm_call_policy)
+    _record_chat_usage(response)
+    return response
+
+
 @observe(name="openai_create")
+@metered("openai_create")
 def openai_create(
     system_template: str,
     human_template: str,
     model: str = "gpt-4o-mini",
     full_response: bool = False,
+    deadline_seconds: Optional[float] = None,
+    hedge: Optional[bool] = None,
 ) -> Union[Dict[str, Any], str]:
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system_template},
-            {"role": "user", "content": human_template},
-        ],
+    response = _cached_call(
+        _chat_cache_key(model, system_template, human_template),
+        lambda: _chat_completion(
+            model,
+            _chat_messages(system_template, human_template),
+            llm_call_policy.replace(deadline_seconds=deadline_seconds, hedge=hedge),
+        ),
     )
     return response if full_response else response.choices[0].message
 
 
 @observe(name="openai_vision_create")
+@metered("openai_vision_create")
 def openai_vision_create(
     system_template: str,
     human_template: str,
@@ -65,28 +631,214 @@ def openai_vision_create(
     model: str = "gpt-4o-mini",
     temperature: float = 0.5,
     full_response: bool = False,
+    preprocess_options: Optional[Dict[str, Any]] = None,
+    deadline_seconds: Optional[float] = None,
+    hedge: Optional[bool] = None,
 ) -> Union[Dict[str, Any], str]:
-    content = [{"type": "text", "text": human_template}]
-    for image in images:
-        content.append(
-            {
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/jpeg;base64, {base64.b64encode(image.read()).decode("utf-8")}"
-                },
-            }
-        )
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system_template},
-            {"role": "user", "content": content},
-        ],
-        temperature=temperature,
+    images_data: List[bytes] = [image.read() for image in images]
+    response = _cached_call(
+        _chat_cache_key(
+            model,
+            system_template,
+            human_template,
+            temperature,
+            images_data,
+            preprocess_options,
+        ),
+        lambda: _chat_completion(
+            model,
+            _chat_messages(
+                system_template,
+                _vision_content(human_template, images_data, preprocess_options),
+            ),
+            llm_call_policy.replace(deadline_seconds=deadline_seconds, hedge=hedge),
+            temperature=temperature,
+        ),
+        cache=vision_cache.get(),
+    )
+    return response if full_response else response.choices[0].message
+
+
+@observe(name="openai_acreate")
+@metered("openai_acreate")
+async def openai_acreate(
+    system_template: str,
+    human_template: str,
+    model: str = "gpt-4o-mini",
+    full_response: bool = False,
+    deadline_seconds: Optional[float] = None,
+    hedge: Optional[bool] = None,
+) -> Union[Dict[str, Any], str]:
+    response = await _cached_acall(
+        _chat_cache_key(model, system_template, human_template),
+        lambda: _achat_completion(
+            model,
+            _chat_messages(system_template, human_template),
+            llm_call_policy.replace(deadline_seconds=deadline_seconds, hedge=hedge),
+        ),
     )
     return response if full_response else response.choices[0].message
 
 
+@observe(name="openai_vision_acreate")
+@metered("openai_vision_acreate")
+async def openai_vision_acreate(
+    system_template: str,
+    human_template: str,
+    images: List,
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.5,
+    full_response: bool = False,
+    preprocess_options: Optional[Dict[str, Any]] = None,
+    deadline_seconds: Optional[float] = None,
+    hedge: Optional[bool] = None,
+) -> Union[Dict[str, Any], str]:
+    images_data: List[bytes] = [image.read() for image in images]
+    response = await _cached_acall(
+        _chat_cache_key(
+            model,
+            system_template,
+            human_template,
+            temperature,
+            images_data,
+            preprocess_options,
+        ),
+        lambda: _achat_completion(
+            model,
+            _chat_messages(
+                system_template,
+                _vision_content(human_template, images_data, preprocess_options),
+            ),
+            llm_call_policy.replace(deadline_seconds=deadline_seconds, hedge=hedge),
+            temperature=temperature,
+        ),
+        cache=vision_cache.get(),
+    )
+    return response if full_response else response.choices[0].message
+
+
+async def abatch_create(
+    calls: List[Dict[str, Any]], max_concurrency: int = 8
+) -> List[Union[Dict[str, Any], str]]:
+    """
+    Runs many chat/vision requests concurrently with a bounded number in flight.
+    Args:
+        calls (List[Dict[str, Any]]): Keyword arguments for each request. Calls with an
+            "images" key go to openai_vision_acreate, the rest to openai_acreate.
+        max_concurrency (int): Maximum number of requests in flight at once.
+    Returns:
+        List[Union[Dict[str, Any], str]]: Results in the same order as `calls`.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _run(call: Dict[str, Any]) -> Union[Dict[str, Any], str]:
+        async with semaphore:
+            if "images" in call:
+                return await openai_vision_acreate(**call)
+            return await openai_acreate(**call)
+
+    return list(await asyncio.gather(*(_run(call) for call in calls)))
+
+
+def batch_create(
+    calls: List[Dict[str, Any]], max_concurrency: int = 8
+) -> List[Union[Dict[str, Any], str]]:
+    """
+    Synchronous entry point for abatch_create, for use from the episode scripts.
+    """
+    return asyncio.run(abatch_create(calls, max_concurrency=max_concurrency))
+
+
+_QUESTIONS_BATCH_INSTRUCTIONS: str = """
+The user sends a JSON object mapping question ids to questions. Answer every
+question using the context above and return a JSON object with the same ids
+as keys and your answers as string values.
+"""
+
+
+@metered("openai_answer_questions")
+def openai_answer_questions(
+    context: str,
+    questions: Dict[str, str],
+    system_template: str = "",
+    model: str = "gpt-4o-mini",
+    validate: Optional[Callable[[str], bool]] = None,
+) -> Dict[str, str]:
+    """
+    Answers many questions over one shared context in a single structured-output
+    call, instead of re-sending the context once per question.
+    Args:
+        context (str): Text shared by all questions, placed first in the system prompt.
+        questions (Dict[str, str]): Question ids mapped to questions.
+        system_template (str): Instructions describing how to answer.
+        model (str): Chat model name.
+        validate (Optional[Callable[[str], bool]]): Acceptance test for an answer.
+            Missing, empty or rejected answers are re-asked one question per call.
+    Returns:
+        Dict[str, str]: Answers keyed by question id.
+    """
+    if not questions:
+        return {}
+    shared_system: str = f"{context}\n{system_template}"
+    human_template: str = json.dumps(questions, ensure_ascii=False)
+    response_format: Dict[str, Any] = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "answers",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {key: {"type": "string"} for key in questions},
+                "required": list(questions),
+                "additionalProperties": False,
+            },
+        },
+    }
+    response = _cached_call(
+        ["openai_questions", model, shared_system, human_template],
+        lambda: _chat_completion(
+            model,
+            _chat_messages(
+                f"{shared_system}\n{_QUESTIONS_BATCH_INSTRUCTIONS}", human_template
+            ),
+            response_format=response_format,
+        ),
+    )
+    try:
+        answers: Dict[str, Any] = json.loads(response.choices[0].message.content)
+    except (TypeError, json.JSONDecodeError):
+        logger.warning("Batched answers were not valid JSON, asking one by one")
+        answers = {}
+    results: Dict[str, str] = {}
+    retry_keys: List[str] = []
+    for key in questions:
+        answer: Any = answers.get(key)
+        if (
+            isinstance(answer, str)
+            and answer.strip()
+            and (validate is None or validate(answer))
+        ):
+            results[key] = answer
+        else:
+            retry_keys.append(key)
+    if retry_keys:
+        logger.debug(f"Re-asking questions one by one: {retry_keys}")
+        retried = batch_create(
+            [
+                {
+                    "system_template": shared_system,
+                    "human_template": questions[key],
+                    "model": model,
+                }
+                for key in retry_keys
+            ]
+        )
+        for key, response in zip(retry_keys, retried):
+            results[key] = response.content
+    return {key: results[key] for key in questions}
+
+
+@metered("openai_image_create")
 def openai_image_create(
     human_template: str,
     model: str = "dall-e-3",
@@ -94,31 +846,169 @@ def openai_image_create(
     size: Literal[
         "256x256", "512x512", "1024x1024", "1792x1024", "1024x1792"
     ] = "1024x1024",
-) -> ImagesResponse:
-    response = client.images.generate(
-        model=model, prompt=human_template, n=n, size=size
-    )
+) -> "ImagesResponse":
+    response = _generate_images(model=model, prompt=human_template, n=n, size=size)
+    record_usage(images=n)
     return response
 
 
-def openai_get_embedding(text: str, model: str = "text-embedding-3-small"):
+EMBEDDING_MAX_INPUTS_PER_REQUEST: int = 2048
+EMBEDDING_MAX_TOKENS_PER_REQUEST: int = 300_000
+
+
+# Embeddings of unchanged text never change for a given model, so the cache is
+# on unless EMBEDDING_CACHE_DIR is set to an empty string.
+embedding_cache: LazyCache[EmbeddingCache] = LazyCache(
+    "EMBEDDING_CACHE_DIR", ".cache/embeddings", EmbeddingCache
+)
+
+
+def enable_embedding_cache(root: str = ".cache/embeddings") -> EmbeddingCache:
+    return embedding_cache.set(EmbeddingCache(root))
+
+
+def disable_embedding_cache() -> None:
+    embedding_cache.set(None)
+
+
+@metered("openai_get_embedding")
+def openai_get_embedding(
+    text: str, model: str = "text-embedding-3-small", dimensions: Optional[int] = None
+):
     text = text.replace("\n", " ")
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
+    cache: Optional[EmbeddingCache] = embedding_cache.get()
+    if cache is not None:
+        cached = cache.get_many([text], model, dimensions)[0]
+        if cached is not None:
+            return cached.tolist()
+    response = call_with_policy(
+        model,
+        lambda timeout: _create_embeddings(
+            input=[text], model=model, dimensions=dimensions, timeout=timeout
+        ),
+        embedding_call_policy,
+    )
+    record_usage(response.usage.prompt_tokens)
+    embedding = response.data[0].embedding
+    if cache is not None:
+        cache.put_many([text], np.asarray([embedding]), model, dimensions)
+    return embedding
 
 
-def whisper_transcribe(
-    path: str, model_name: str = "turbo", full_response: bool = False
-) -> Union[Dict[str, Any], str]:
-    model = whisper.load_model(model_name)
-    result = model.transcribe(path)
-    return result if full_response else result["text"]
+def _embedding_batches(
+    texts: List[str],
+    model: str,
+    max_inputs: int = EMBEDDING_MAX_INPUTS_PER_REQUEST,
+    max_tokens: int = EMBEDDING_MAX_TOKENS_PER_REQUEST,
+) -> List[List[int]]:
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    batch_tokens: int = 0
+    for index, text in enumerate(texts):
+        tokens: int = count_tokens(text, model)
+        if batch and (len(batch) >= max_inputs or batch_tokens + tokens > max_tokens):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(index)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+@metered("openai_aget_embeddings")
+async def openai_aget_embeddings(
+    texts: List[str],
+    model: str = "text-embedding-3-small",
+    dimensions: Optional[int] = None,
+    max_concurrency: int = 4,
+) -> np.ndarray:
+    texts = [text.replace("\n", " ") for text in texts]
+    cache: Optional[EmbeddingCache] = embedding_cache.get()
+    cached: List[Optional[np.ndarray]] = (
+        cache.get_many(texts, model, dimensions)
+        if cache is not None
+        else [None] * len(texts)
+    )
+    missing: List[int] = [
+        index for index, vector in enumerate(cached) if vector is None
+    ]
+    fetched: np.ndarray = await _fetch_embeddings(
+        [texts[index] for index in missing], model, dimensions, max_concurrency
+    )
+    if cache is not None and missing:
+        cache.put_many([texts[index] for index in missing], fetched, model, dimensions)
+    for index, vector in zip(missing, fetched):
+        cached[index] = vector
+    if not cached:
+        return np.empty((0, dimensions or 0), dtype=np.float32)
+    return np.stack(cached).astype(np.float32, copy=False)
+
+
+async def _fetch_embeddings(
+    texts: List[str],
+    model: str,
+    dimensions: Optional[int],
+    max_concurrency: int,
+) -> np.ndarray:
+    batches: List[List[int]] = _embedding_batches(texts, model)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _embed(batch: List[int]) -> List[List[float]]:
+        async with semaphore:
+            response = await acall_with_policy(
+                model,
+                lambda timeout: _acreate_embeddings(
+                    input=[texts[index] for index in batch],
+                    model=model,
+                    dimensions=dimensions,
+                    timeout=timeout,
+                ),
+                embedding_call_policy,
+            )
+        record_usage(response.usage.prompt_tokens)
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    batch_vectors = await asyncio.gather(*(_embed(batch) for batch in batches))
+    vectors: List[Optional[List[float]]] = [None] * len(texts)
+    for batch, embeddings in zip(batches, batch_vectors):
+        for index, embedding in zip(batch, embeddings):
+            vectors[index] = embedding
+    if not vectors:
+        return np.empty((0, dimensions or 0), dtype=np.float32)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+@metered("openai_get_embeddings")
+def openai_get_embeddings(
+    texts: List[str],
+    model: str = "text-embedding-3-small",
+    dimensions: Optional[int] = None,
+    max_concurrency: int = 4,
+) -> np.ndarray:
+    """
+    Embeds many texts with as few requests as the provider limits allow.
+    Inputs are packed into requests of at most EMBEDDING_MAX_INPUTS_PER_REQUEST
+    items and EMBEDDING_MAX_TOKENS_PER_REQUEST tokens, sent concurrently. Texts
+    already in the embedding cache are not sent at all.
+    Args:
+        texts (List[str]): Texts to embed.
+        model (str): Embedding model name.
+        dimensions (Optional[int]): Output dimensionality for models that support shortening.
+        max_concurrency (int): Maximum number of requests in flight at once.
+    Returns:
+        np.ndarray: float32 array of shape (len(texts), dimensions), in input order.
+    """
+    return asyncio.run(
+        openai_aget_embeddings(texts, model, dimensions, max_concurrency)
+    )
 
 
 def aidevs_send_answer(task: str, answer: Any) -> requests.Response:
     apikey: str = os.getenv("AIDEVS3_API_KEY")
     url: str = os.getenv("AIDEVS3_API_URL")
     payload: Dict[str, Any] = {"task": task, "apikey": apikey, "answer": answer}
-    return requests.post(url, json=payload)
+    return http_client.post(url, json=payload)
 
 
 def aidevs_s03e03_query(user_query: Any) -> requests.Response:
@@ -126,11 +1016,11 @@ def aidevs_s03e03_query(user_query: Any) -> requests.Response:
     apikey: str = os.getenv("AIDEVS3_API_KEY")
     url: str = os.getenv("S03E03_API_URL")
     payload: Dict[str, Any] = {"task": task, "apikey": apikey, "query": user_query}
-    return requests.post(url, json=payload)
+    return http_client.post(url, json=payload)
 
 
 def aidevs_s03e04_query(user_query: Any, system_name: str) -> requests.Response:
     apikey: str = os.getenv("AIDEVS3_API_KEY")
     url: str = os.getenv(system_name)
     payload: Dict[str, Any] = {"apikey": apikey, "query": user_query}
-    return requests.post(url, json=payload)
+    return http_client.post(url, json=payload)
@@ -0,0 +1,56 @@
+from typing import Any, Dict, Optional
+
+import utils_ai
+import utils_whisper
+from utils_cache import SqliteCache, make_cache_key
+
+
+def get_artifact(
+    path: str, transform: str, params: Optional[Dict[str, Any]] = None
+) -> Optional[Any]:
+    """
+    Returns what an episode already derived from the content of the file at
+    `path`, whatever it was called then, or None. Nothing is computed: image
+    analyses and transcripts are cached by content hash where they are made,
+    and this only looks them up.
+    Args:
+        transform (str): "vision" for an openai_vision_create answer about the
+            image, "transcript" for a whisper transcript of the recording.
+        params (Optional[Dict[str, Any]]): The arguments the derivation ran
+            with. For "vision": system_template, human_template, model,
+            temperature and preprocess_options, with openai_vision_create's
+            defaults. For "transcript": model_name plus any whisper options.
+    Returns:
+        Optional[Any]: The answer text or transcript text.
+    Raises:
+        ValueError: For an unknown transform.
+    """
+    params = dict(params or {})
+    if transform == "vision":
+        vision_cache: Optional[SqliteCache] = utils_ai.vision_cache.get()
+        if vision_cache is None:
+            return None
+        with open(path, "rb") as file:
+            image_data: bytes = file.read()
+        key_parts = utils_ai._chat_cache_key(
+            params.get("model", "gpt-4o-mini"),
+            params.get("system_template", ""),
+            params.get("human_template", ""),
+            params.get("temperature", 0.5),
+            [image_data],
+            params.get("preprocess_options"),
+        )
+        response = vision_cache.get(make_cache_key(*key_parts))
+        return None if response is None else response.choices[0].message.content
+    if transform == "transcript":
+        transcription_cache: Optional[SqliteCache] = (
+            utils_whisper.transcription_cache.get()
+        )
+        if transcription_cache is None:
+            return None
+        model_name: str = params.pop("model_name", "turbo")
+        result = transcription_cache.get(
+            utils_whisper._transcription_cache_key(path, model_name, params)
+        )
+        return None if result is None else result["text"]
+    raise ValueError(f"Unknown transform: {transform}")
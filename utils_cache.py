@@ -0,0 +1,467 @@
+import hashlib
+import json
+import numpy as np
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import closing
+from loguru import logger
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+
+def make_cache_key(*parts: Any) -> str:
+    """
+    Builds a stable content-addressed key from arbitrary JSON-serialisable parts.
+    Args:
+        *parts (Any): Values identifying the cached computation (model, messages, hashes, ...).
+    Returns:
+        str: Hex SHA-256 digest of the normalised parts.
+    """
+    normalised: str = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(normalised.encode("utf-8")).hexdigest()
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SqliteCache:
+    """
+    On-disk key/value cache stored in SQLite, safe to share between processes.
+
+    Values are pickled. Least recently used entries are dropped by the write
+    that takes the namespace past `max_entries` or `max_bytes`. Entries older
+    than `max_age_seconds` are never served and are deleted every
+    _EVICT_EVERY writes. With `memory_entries` set, the most recently used
+    values are also kept in process memory so repeat lookups skip SQLite.
+    """
+
+    _EVICT_EVERY: int = 64
+
+    def __init__(
+        self,
+        path: str,
+        namespace: str = "default",
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_age_seconds: Optional[float] = None,
+        memory_entries: int = 0,
+    ):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits: int = 0
+        self.misses: int = 0
+        self._writes: int = 0
+        self._lock = threading.Lock()
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed "
+                "ON cache_entries (namespace, accessed_at)"
+            )
+        self.evict()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _remember(self, key: str, created_at: float, value: Any) -> None:
+        if not self.memory_entries:
+            return
+        with self._lock:
+            self._memory[key] = (created_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _recall(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if (
+                self.max_age_seconds is not None
+                and time.time() - entry[0] > self.max_age_seconds
+            ):
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._recall(key)
+        if value is not None:
+            return value
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            now = time.time()
+            expired = (
+                row is not None
+                and self.max_age_seconds is not None
+                and now - row[1] > self.max_age_seconds
+            )
+            if row is not None and not expired:
+                conn.execute(
+                    "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (now, self.namespace, key),
+                )
+        if row is None or expired:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        value = pickle.loads(row[0])
+        self._remember(key, row[1], value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        blob: bytes = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        over_limit: bool = False
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries "
+                "(namespace, key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, blob, len(blob), now, now),
+            )
+            if self.max_entries is not None or self.max_bytes is not None:
+                entries, size = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+                    (self.namespace,),
+                ).fetchone()
+                over_limit = (
+                    self.max_entries is not None and entries > self.max_entries
+                ) or (self.max_bytes is not None and size > self.max_bytes)
+        self._remember(key, now, value)
+        with self._lock:
+            self._writes += 1
+            should_evict = over_limit or self._writes % self._EVICT_EVERY == 0
+        if should_evict:
+            self.evict()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def evict(self) -> int:
+        """
+        Drops expired entries, then least recently used ones over the size limits.
+        Returns:
+            int: Number of evicted entries.
+        """
+        removed: int = 0
+        with closing(self._connect()) as conn, conn:
+            if self.max_age_seconds is not None:
+                removed += conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND created_at < ?",
+                    (self.namespace, time.time() - self.max_age_seconds),
+                ).rowcount
+            if self.max_entries is not None:
+                removed += conn.execute(
+                    """
+                    DELETE FROM cache_entries WHERE namespace = ? AND key NOT IN (
+                        SELECT key FROM cache_entries WHERE namespace = ?
+                        ORDER BY accessed_at DESC LIMIT ?
+                    )
+                    """,
+                    (self.namespace, self.namespace, self.max_entries),
+                ).rowcount
+            if self.max_bytes is not None:
+                total: int = conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+                    (self.namespace,),
+                ).fetchone()[0]
+                rows = conn.execute(
+                    "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY accessed_at ASC",
+                    (self.namespace,),
+                )
+                stale_keys = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    stale_keys.append((self.namespace, key))
+                    total -= size
+                conn.executemany(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                    stale_keys,
+                )
+                removed += len(stale_keys)
+        if removed:
+            logger.debug(f"Evicted {removed} entries from cache {self.namespace}")
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with closing(self._connect()) as conn:
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+                (self.namespace,),
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+class EmbeddingStore:
+    """
+    Append-only float32 vector file plus a SQLite index of key -> row.
+
+    The vector file is memory-mapped read-only, so lookups return views into
+    the page cache instead of materialising Python lists. Writers serialise on
+    the SQLite write lock, which makes appends safe across processes.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path: str = os.path.join(directory, "vectors.f32")
+        self.index_path: str = os.path.join(directory, "index.sqlite")
+        self.dimensions: Optional[int] = None
+        self._map: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, row INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._load_dimensions(conn)
+        if not os.path.exists(self.vectors_path):
+            open(self.vectors_path, "ab").close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _load_dimensions(self, conn: sqlite3.Connection) -> None:
+        row = conn.execute(
+            "SELECT value FROM meta WHERE name = 'dimensions'"
+        ).fetchone()
+        if row is not None:
+            self.dimensions = int(row[0])
+
+    def _vectors(self, min_rows: int) -> np.ndarray:
+        with self._lock:
+            if self._map is None or len(self._map) < min_rows:
+                rows: int = os.path.getsize(self.vectors_path) // (self.dimensions * 4)
+                self._map = np.memmap(
+                    self.vectors_path,
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(rows, self.dimensions),
+                )
+            return self._map
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        rows: Dict[str, int] = {}
+        with closing(self._connect()) as conn:
+            for start in range(0, len(keys), 500):
+                batch = list(keys[start : start + 500])
+                placeholders: str = ",".join("?" * len(batch))
+                rows.update(
+                    conn.execute(
+                        f"SELECT key, row FROM vectors WHERE key IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                )
+            if rows and self.dimensions is None:
+                self._load_dimensions(conn)
+        if not rows:
+            return [None] * len(keys)
+        vectors: np.ndarray = self._vectors(max(rows.values()) + 1)
+        return [vectors[rows[key]] if key in rows else None for key in keys]
+
+    def put_many(self, keys: Sequence[str], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.dimensions is None:
+                    self.dimensions = int(vectors.shape[1])
+                    conn.execute(
+                        "INSERT OR IGNORE INTO meta (name, value) VALUES ('dimensions', ?)",
+                        (str(self.dimensions),),
+                    )
+                next_row: int = conn.execute(
+                    "SELECT COALESCE(MAX(row) + 1, 0) FROM vectors"
+                ).fetchone()[0]
+                with open(self.vectors_path, "r+b") as file:
+                    for key, vector in zip(keys, vectors):
+                        inserted = conn.execute(
+                            "INSERT OR IGNORE INTO vectors (key, row) VALUES (?, ?)",
+                            (key, next_row),
+                        ).rowcount
+                        if not inserted:
+                            continue
+                        file.seek(next_row * self.dimensions * 4)
+                        file.write(vector.tobytes())
+                        next_row += 1
+                    file.flush()
+                    os.fsync(file.fileno())
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+
+def normalize_embedding_text(text: str) -> str:
+    return unicodedata.normalize("NFC", re.sub(r"\s+", " ", text)).strip()
+
+
+class EmbeddingCache:
+    """
+    Embedding cache keyed by hash(normalised text), with one EmbeddingStore
+    per (model, dimensions) pair under `root`.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.hits: int = 0
+        self.misses: int = 0
+        self._stores: Dict[str, EmbeddingStore] = {}
+        self._lock = threading.Lock()
+
+    def _store(self, model: str, dimensions: Optional[int]) -> EmbeddingStore:
+        name: str = f"{model}-{dimensions or 'default'}"
+        with self._lock:
+            if name not in self._stores:
+                self._stores[name] = EmbeddingStore(os.path.join(self.root, name))
+            return self._stores[name]
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hash_bytes(normalize_embedding_text(text).encode("utf-8"))
+
+    def get_many(
+        self, texts: Sequence[str], model: str, dimensions: Optional[int] = None
+    ) -> List[Optional[np.ndarray]]:
+        vectors = self._store(model, dimensions).get_many(
+            [self._key(text) for text in texts]
+        )
+        found: int = sum(vector is not None for vector in vectors)
+        with self._lock:
+            self.hits += found
+            self.misses += len(vectors) - found
+        return vectors
+
+    def put_many(
+        self,
+        texts: Sequence[str],
+        vectors: np.ndarray,
+        model: str,
+        dimensions: Optional[int] = None,
+    ) -> None:
+        if len(texts):
+            self._store(model, dimensions).put_many(
+                [self._key(text) for text in texts], vectors
+            )
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+T = TypeVar("T")
+
+
+class LazyCache(Generic[T]):
+    """
+    A process-wide cache whose location comes from the environment variable
+    `env_var` and which is only opened on first use, so importing a module
+    creates no files. An empty value turns it off; without `default_path`
+    it is off unless the variable is set. enable/disable replace whatever
+    the environment chose.
+    """
+
+    def __init__(
+        self,
+        env_var: str,
+        default_path: Optional[str],
+        open_cache: Callable[[str], T],
+    ):
+        self.env_var = env_var
+        self.default_path = default_path
+        self.open_cache = open_cache
+        self._cache: Optional[T] = None
+        self._resolved: bool = False
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[T]:
+        if not self._resolved:
+            with self._lock:
+                if not self._resolved:
+                    path: str = os.getenv(self.env_var, self.default_path or "")
+                    self._cache = self.open_cache(path) if path else None
+                    self._resolved = True
+        return self._cache
+
+    def set(self, cache: Optional[T]) -> Optional[T]:
+        with self._lock:
+            self._cache = cache
+            self._resolved = True
+        return cache
@@ -1,11 +1,18 @@
+import hashlib
 import os
 import re
 import requests
-from bs4 import BeautifulSoup
+import tempfile
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
-from typing import Dict, List, Optional
-from urllib.parse import urljoin
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from utils_cache import LazyCache, SqliteCache, hash_file
+from utils_html import html_to_markdown
+from utils_http import http_client
 
 
 def transfer_webpage_to_markdown(url: str, output_dir: str, markdown_name: str) -> None:
@@ -14,41 +21,24 @@ def transfer_webpage_to_markdown(url: str, output_dir: str, markdown_name: str)
         os.makedirs(output_dir, exist_ok=True)
 
         # Fetch the HTML content of the page
-        response: requests.Response = requests.get(url)
+        response: requests.Response = http_client.get(url)
         response.raise_for_status()
-        html_content: str = response.text
-
-        # Parse the HTML content with BeautifulSoup
-        soup: BeautifulSoup = BeautifulSoup(html_content, "html.parser")
-
-        # Initialize Markdown content
-        markdown_content: list[str] = []
-
-        # Replace images
-        img: Optional[BeautifulSoup.Tag]
-        for img in soup.find_all("img"):
-            img_url: str = urljoin(url, img.get("src", ""))
-            img_name: str = os.path.basename(img_url)
-            download_file_from_url(img_url, output_dir)
-            img.replace_with(f"<img>{img_name}</img>")
-
-        # Replace MP3 links
-        link: Optional[BeautifulSoup.Tag]
-        for link in soup.find_all(
-            "a", href=lambda href: href and href.endswith(".mp3")
-        ):
-            mp3_url: str = urljoin(url, link.get("href", ""))
-            mp3_name: str = os.path.basename(mp3_url)
-            download_file_from_url(mp3_url, output_dir)
-            link.replace_with(f"<audio>{mp3_name}</audio>")
-
-        # Extract and append the modified HTML content as Markdown
-        markdown_content.append(soup.get_text())
+
+        # Convert to Markdown, with images and MP3 links replaced by
+        # <img>name</img> / <audio>name</audio> placeholders
+        page: Dict[str, Any] = html_to_markdown(
+            response.content, url, media_placeholders=True
+        )
+
+        # Fetch all discovered assets together
+        download_files_from_urls(
+            [asset["url"] for asset in page["images"] + page["audio"]], output_dir
+        )
 
         # Save the Markdown content to a file
         markdown_file: str = os.path.join(output_dir, markdown_name)
         with open(markdown_file, "w", encoding="utf-8") as file:
-            file.write("\n".join(markdown_content))
+            file.write(page["markdown"])
 
         logger.info(f"Markdown content saved to {markdown_file}")
     except Exception as e:
@@ -79,31 +69,184 @@ def replace_placeholders_in_text(
     return text
 
 
-def download_file_from_url(file_url: str, output_dir: str) -> None:
+def _open_download_cache(path: str) -> SqliteCache:
+    return SqliteCache(path, namespace="downloads", max_entries=100_000)
+
+
+# Episodes re-download the same files on every run and repair iteration, so
+# this is on unless DOWNLOAD_CACHE_PATH is set to an empty string.
+download_cache: LazyCache[SqliteCache] = LazyCache(
+    "DOWNLOAD_CACHE_PATH", ".cache/download_cache.sqlite", _open_download_cache
+)
+
+
+def enable_download_cache(path: str = ".cache/download_cache.sqlite") -> SqliteCache:
+    """
+    Turns on the record of downloaded files (validators, size, hash and
+    mtime per URL) that lets download_file_from_url skip unchanged files.
+    """
+    return download_cache.set(_open_download_cache(path))
+
+
+def disable_download_cache() -> None:
+    download_cache.set(None)
+
+
+def _local_copy_matches(
+    file_path: str,
+    size: Optional[int],
+    sha256: Optional[str],
+    mtime_ns: Optional[int] = None,
+) -> bool:
+    """
+    Checks a local file against an expected size and/or hash. The file is
+    only hashed when its size matches and its mtime differs from `mtime_ns`.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return False
+    if size is not None and stat.st_size != size:
+        return False
+    if sha256 is None or (mtime_ns is not None and stat.st_mtime_ns == mtime_ns):
+        return size is not None or sha256 is not None
+    return hash_file(file_path) == sha256
+
+
+def download_file_from_url(
+    file_url: str,
+    output_dir: str,
+    expected_size: Optional[int] = None,
+    expected_sha256: Optional[str] = None,
+) -> Optional[str]:
     """
     Downloads a file from the given URL and saves it to the specified directory.
+
+    A local copy matching `expected_size`/`expected_sha256` is used without a
+    request. Otherwise, if the file was downloaded before and is unchanged on
+    disk, the request is conditional (If-None-Match / If-Modified-Since) and a
+    304 keeps the local copy. New content is written to a temporary file and
+    moved into place, so readers never see a partial file.
     Args:
         file_url (str): The URL of the file to download.
         output_dir (str): Directory to save the downloaded file.
+        expected_size (Optional[int]): Known size of the file in bytes.
+        expected_sha256 (Optional[str]): Known SHA-256 of the file.
     Returns:
-        None
+        Optional[str]: Path of the saved file, or None if the download failed.
     """
+    # Extract the file name from the URL
+    file_name: str = os.path.basename(file_url)
+    file_path: str = os.path.join(output_dir, file_name)
+    if (expected_size is not None or expected_sha256 is not None) and (
+        _local_copy_matches(file_path, expected_size, expected_sha256)
+    ):
+        logger.debug(f"Already downloaded: {file_name}")
+        return file_path
+
+    cache: Optional[SqliteCache] = download_cache.get()
+    record: Optional[Dict[str, Any]] = (
+        cache.get(file_url) if cache is not None else None
+    )
+    headers: Dict[str, str] = {}
+    if record is not None and _local_copy_matches(
+        file_path, record["size"], record["sha256"], record["mtime_ns"]
+    ):
+        if record["etag"]:
+            headers["If-None-Match"] = record["etag"]
+        if record["last_modified"]:
+            headers["If-Modified-Since"] = record["last_modified"]
+
+    temp_path: Optional[str] = None
     try:
         # Fetch the file
-        response: requests.Response = requests.get(file_url, stream=True)
-        response.raise_for_status()
+        response: requests.Response = http_client.get(
+            file_url, stream=True, headers=headers
+        )
+        with response:
+            if response.status_code == 304 and headers:
+                logger.debug(f"Not modified: {file_name}")
+                return file_path
+            response.raise_for_status()
 
-        # Extract the file name from the URL
-        file_name: str = os.path.basename(file_url)
-        file_path: str = os.path.join(output_dir, file_name)
+            # Write to a temporary file next to the target, hashing on the way
+            os.makedirs(output_dir, exist_ok=True)
+            digest = hashlib.sha256()
+            size: int = 0
+            with tempfile.NamedTemporaryFile(
+                "wb", dir=output_dir, prefix=f".{file_name}.", delete=False
+            ) as file:
+                temp_path = file.name
+                for chunk in response.iter_content(chunk_size=65536):
+                    file.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            sha256: str = digest.hexdigest()
+            if expected_sha256 is not None and sha256 != expected_sha256:
+                raise ValueError(f"SHA-256 mismatch: got {sha256}")
+            os.replace(temp_path, file_path)
+            temp_path = None
 
-        # Write the file content to the output directory
-        with open(file_path, "wb") as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-        logger.info(f"Downloaded: {file_name}")
+            if cache is not None:
+                cache.set(
+                    file_url,
+                    {
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                        "size": size,
+                        "sha256": sha256,
+                        "mtime_ns": os.stat(file_path).st_mtime_ns,
+                    },
+                )
+        logger.info(f"Downloaded: {file_name} ({size} bytes)")
+        return file_path
     except Exception as e:
         logger.warning(f"Failed to download {file_url}: {e}")
+        return None
+    finally:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+# Downloads share http_client's connection pool (32 connections); keep the
+# per-host limit below it so one slow host cannot starve the others.
+DOWNLOAD_WORKERS: int = int(os.getenv("DOWNLOAD_WORKERS", 16))
+DOWNLOADS_PER_HOST: int = int(os.getenv("DOWNLOADS_PER_HOST", 6))
+
+
+def download_files_from_urls(
+    file_urls: List[str],
+    output_dir: str,
+    max_workers: int = DOWNLOAD_WORKERS,
+    per_host: int = DOWNLOADS_PER_HOST,
+) -> Dict[str, Optional[str]]:
+    """
+    Downloads files concurrently, at most `per_host` at a time from any one
+    host, reusing http_client's keep-alive connections. Repeated URLs are
+    fetched once.
+    Returns:
+        Dict[str, Optional[str]]: Saved path (None on failure) per URL.
+    """
+    unique_urls: List[str] = list(dict.fromkeys(file_urls))
+    if not unique_urls:
+        return {}
+    host_limits: Dict[str, threading.Semaphore] = {
+        urlsplit(file_url).netloc: threading.Semaphore(max(1, per_host))
+        for file_url in unique_urls
+    }
+
+    def _download(file_url: str) -> Optional[str]:
+        with host_limits[urlsplit(file_url).netloc]:
+            return download_file_from_url(file_url, output_dir)
+
+    workers: int = max(1, min(max_workers, len(unique_urls)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        paths: List[Optional[str]] = list(executor.map(_download, unique_urls))
+    logger.info(
+        f"Downloaded {sum(p is not None for p in paths)}/{len(unique_urls)} files "
+        f"to {output_dir}"
+    )
+    return dict(zip(unique_urls, paths))
 
 
 def group_files_by_type(
@@ -0,0 +1,295 @@
+import asyncio
+import contextvars
+import copy
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from loguru import logger
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from utils_http import RETRY_STATUS_CODES
+
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Timeouts, connection failures and 429/5xx responses, for both the OpenAI
+    SDK (matched by name, so the SDK is not imported here) and plain Python.
+    """
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status_code: Optional[int] = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRY_STATUS_CODES
+    return type(error).__name__ in ("APITimeoutError", "APIConnectionError")
+
+
+class LatencyTracker:
+    """
+    Recent successful call latencies per key, used to pick hedging delays.
+    """
+
+    def __init__(self, window: int = 200):
+        self._samples: Dict[str, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=window)
+        )
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def quantile(self, key: str, q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples: List[float] = sorted(self._samples.get(key, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[int(q * (len(samples) - 1))]
+
+
+class CallPolicy:
+    """
+    Deadline, hedging and retry settings for a kind of remote call.
+
+    `deadline_seconds` bounds the whole call including retries. With `hedge`
+    on, a duplicate request is sent once the first has been running for the
+    `hedge_quantile` latency of recent calls (or `hedge_after_seconds` until
+    `hedge_min_samples` calls have been seen); the first response wins.
+    Transient failures are retried up to `max_retries` times with
+    full-jitter exponential backoff.
+    """
+
+    def __init__(
+        self,
+        deadline_seconds: Optional[float] = None,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_after_seconds: Optional[float] = None,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        is_transient: Callable[[BaseException], bool] = is_transient_error,
+    ):
+        self.deadline_seconds = deadline_seconds
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_after_seconds = hedge_after_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.is_transient = is_transient
+
+    def replace(self, **changes: Any) -> "CallPolicy":
+        policy = copy.copy(self)
+        for name, value in changes.items():
+            if value is not None:
+                setattr(policy, name, value)
+        return policy
+
+
+latencies = LatencyTracker()
+# Sync calls with a deadline or hedging run in threads. A thread cannot be
+# interrupted mid-request, so a losing or overdue sync request finishes in the
+# background (bounded by its timeout) and its result is dropped; async losers
+# are cancelled outright.
+_hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _attempt_timeout(deadline: Optional[float]) -> Optional[float]:
+    remaining: Optional[float] = _remaining(deadline)
+    return None if remaining is None else max(remaining, 0.001)
+
+
+def _in_hedge_pool() -> bool:
+    return threading.current_thread().name.startswith("hedge")
+
+
+def _hedge_delay(key: str, policy: CallPolicy) -> Optional[float]:
+    if not policy.hedge:
+        return None
+    delay: Optional[float] = latencies.quantile(
+        key, policy.hedge_quantile, policy.hedge_min_samples
+    )
+    return delay if delay is not None else policy.hedge_after_seconds
+
+
+def _retry_delay(
+    key: str,
+    policy: CallPolicy,
+    attempt: int,
+    error: Exception,
+    deadline: Optional[float],
+) -> float:
+    """
+    Returns how long to wait before the next attempt, or re-raises `error`
+    when it should not be retried.
+    """
+    remaining: Optional[float] = _remaining(deadline)
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(
+            f"{key} missed its {policy.deadline_seconds}s deadline"
+        ) from error
+    if attempt >= policy.max_retries or not policy.is_transient(error):
+        raise error
+    delay: float = random.uniform(
+        0, min(policy.backoff_max, policy.backoff_base * 2**attempt)
+    )
+    if remaining is not None:
+        delay = min(delay, remaining)
+    logger.warning(f"{key} failed ({error}), retrying in {delay:.2f}s")
+    return delay
+
+
+def call_with_policy(
+    key: str, call: Callable[[Optional[float]], T], policy: CallPolicy
+) -> T:
+    """
+    Runs `call(timeout)` under `policy`. `timeout` is the time left until the
+    deadline (None without one) and should be passed on to the client.
+    Latencies are tracked per `key`, typically the model name.
+    Raises:
+        DeadlineExceeded: If no attempt succeeded before the deadline.
+    """
+    deadline: Optional[float] = (
+        time.monotonic() + policy.deadline_seconds
+        if policy.deadline_seconds is not None
+        else None
+    )
+    attempt: int = 0
+    while True:
+        try:
+            return _hedged_call(key, call, policy, deadline)
+        except Exception as e:
+            time.sleep(_retry_delay(key, policy, attempt, e, deadline))
+            attempt += 1
+
+
+def _hedged_call(
+    key: str,
+    call: Callable[[Optional[float]], T],
+    policy: CallPolicy,
+    deadline: Optional[float],
+) -> T:
+    start: float = time.perf_counter()
+    delay: Optional[float] = _hedge_delay(key, policy)
+    if delay is None and (deadline is None or _in_hedge_pool()):
+        # Without a deadline, or nested in a call that already runs in the
+        # pool (whose caller enforces the outer deadline), the call runs here
+        # and the deadline is only checked once it returns.
+        result: T = call(_attempt_timeout(deadline))
+        remaining: Optional[float] = _remaining(deadline)
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(f"{key} missed its deadline")
+        latencies.record(key, time.perf_counter() - start)
+        return result
+
+    def _submit() -> Future:
+        # Each thread gets its own copy of the caller's context (metrics, replay).
+        return _hedge_pool.submit(
+            contextvars.copy_context().run, call, _attempt_timeout(deadline)
+        )
+
+    # With a deadline the call runs in a thread even without hedging, so a
+    # client that ignores its timeout cannot hold the caller past it.
+    futures: List[Future] = [_submit()]
+    if delay is not None:
+        remaining = _remaining(deadline)
+        wait(futures, timeout=delay if remaining is None else min(delay, remaining))
+        if not futures[0].done():
+            logger.debug(f"{key} slower than {delay:.2f}s, sending a hedged request")
+            futures.append(_submit())
+    error: Optional[BaseException] = None
+    while futures:
+        done, _ = wait(
+            futures, timeout=_remaining(deadline), return_when=FIRST_COMPLETED
+        )
+        if not done:
+            raise DeadlineExceeded(f"{key} missed its deadline")
+        for future in done:
+            futures.remove(future)
+            if future.exception() is None:
+                for loser in futures:
+                    loser.cancel()
+                latencies.record(key, time.perf_counter() - start)
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def acall_with_policy(
+    key: str, call: Callable[[Optional[float]], Awaitable[T]], policy: CallPolicy
+) -> T:
+    """
+    Async counterpart of call_with_policy; losing hedged requests are cancelled.
+    """
+    deadline: Optional[float] = (
+        time.monotonic() + policy.deadline_seconds
+        if policy.deadline_seconds is not None
+        else None
+    )
+    attempt: int = 0
+    while True:
+        try:
+            return await _ahedged_call(key, call, policy, deadline)
+        except Exception as e:
+            await asyncio.sleep(_retry_delay(key, policy, attempt, e, deadline))
+            attempt += 1
+
+
+async def _ahedged_call(
+    key: str,
+    call: Callable[[Optional[float]], Awaitable[T]],
+    policy: CallPolicy,
+    deadline: Optional[float],
+) -> T:
+    start: float = time.perf_counter()
+    delay: Optional[float] = _hedge_delay(key, policy)
+    tasks: List[asyncio.Task] = [
+        asyncio.ensure_future(call(_attempt_timeout(deadline)))
+    ]
+    try:
+        if delay is not None:
+            remaining: Optional[float] = _remaining(deadline)
+            await asyncio.wait(
+                tasks, timeout=delay if remaining is None else min(delay, remaining)
+            )
+            if not tasks[0].done():
+                logger.debug(
+                    f"{key} slower than {delay:.2f}s, sending a hedged request"
+                )
+                tasks.append(asyncio.ensure_future(call(_attempt_timeout(deadline))))
+        error: Optional[BaseException] = None
+        while tasks:
+            done, _ = await asyncio.wait(
+                tasks,
+                timeout=_remaining(deadline),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                raise DeadlineExceeded(f"{key} missed its deadline")
+            for task in done:
+                tasks.remove(task)
+                if task.exception() is None:
+                    latencies.record(key, time.perf_counter() - start)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,279 @@
+import os
+import re
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import urljoin
+
+if TYPE_CHECKING:
+    from lxml.html import HtmlElement
+
+
+AUDIO_EXTENSIONS: Tuple[str, ...] = (".mp3",)
+
+_SKIP_TAGS = frozenset(
+    {"head", "script", "style", "noscript", "template", "svg", "iframe", "object"}
+)
+_BLOCK_TAGS = frozenset(
+    {
+        "address",
+        "article",
+        "aside",
+        "blockquote",
+        "body",
+        "dd",
+        "details",
+        "dl",
+        "dt",
+        "div",
+        "fieldset",
+        "figcaption",
+        "figure",
+        "footer",
+        "form",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+        "header",
+        "hr",
+        "li",
+        "main",
+        "nav",
+        "ol",
+        "p",
+        "pre",
+        "section",
+        "summary",
+        "table",
+        "ul",
+    }
+)
+_WHITESPACE = re.compile(r"\s+")
+
+
+class _MarkdownRenderer:
+    """
+    Walks an lxml tree once, rendering Markdown blocks and collecting links,
+    images and audio files on the way.
+    """
+
+    def __init__(self, base_url: str, media_placeholders: bool):
+        self.base_url = base_url
+        self.media_placeholders = media_placeholders
+        self.links: List[Dict[str, str]] = []
+        self.images: List[Dict[str, str]] = []
+        self.audio: List[Dict[str, str]] = []
+
+    def blocks(self, element: "HtmlElement", out: List[str]) -> List[str]:
+        inline: List[str] = []
+
+        def _flush() -> None:
+            text: str = "\n".join(line.strip() for line in "".join(inline).split("\n"))
+            if text.strip():
+                out.append(text.strip())
+            inline.clear()
+
+        if element.text:
+            inline.append(_WHITESPACE.sub(" ", element.text))
+        for child in element:
+            tag: Optional[str] = child.tag if isinstance(child.tag, str) else None
+            if tag is None or tag in _SKIP_TAGS:
+                pass
+            elif tag in _BLOCK_TAGS:
+                _flush()
+                self.block(child, tag, out)
+            else:
+                inline.append(self.inline(child))
+            if child.tail:
+                inline.append(_WHITESPACE.sub(" ", child.tail))
+        _flush()
+        return out
+
+    def block(self, element: "HtmlElement", tag: str, out: List[str]) -> None:
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            text: str = _WHITESPACE.sub(" ", self.inline_children(element)).strip()
+            if text:
+                out.append(f"{'#' * int(tag[1])} {text}")
+        elif tag in ("ul", "ol"):
+            lines: List[str] = self.list_lines(element, ordered=tag == "ol")
+            if lines:
+                out.append("\n".join(lines))
+        elif tag == "pre":
+            out.append(f"```\n{element.text_content().strip(chr(10))}\n```")
+        elif tag == "blockquote":
+            quoted: str = "\n\n".join(self.blocks(element, []))
+            if quoted:
+                out.append(
+                    "\n".join(
+                        f"> {line}" if line else ">" for line in quoted.split("\n")
+                    )
+                )
+        elif tag == "table":
+            table: Optional[str] = self.table(element)
+            if table:
+                out.append(table)
+        elif tag == "hr":
+            out.append("---")
+        else:
+            self.blocks(element, out)
+
+    def list_lines(self, element: "HtmlElement", ordered: bool) -> List[str]:
+        lines: List[str] = []
+        items = [child for child in element if child.tag == "li"]
+        for index, item in enumerate(items, start=1):
+            marker: str = f"{index}. " if ordered else "- "
+            item_lines: List[str] = "\n".join(self.blocks(item, [])).split("\n")
+            if not item_lines[0] and len(item_lines) == 1:
+                continue
+            lines.append(marker + item_lines[0])
+            lines += [
+                " " * len(marker) + line if line else "" for line in item_lines[1:]
+            ]
+        return lines
+
+    def table(self, element: "HtmlElement") -> Optional[str]:
+        rows: List[List[str]] = []
+        for row in element.iter("tr"):
+            cells: List[str] = [
+                _WHITESPACE.sub(" ", self.inline_children(cell))
+                .strip()
+                .replace("|", "\\|")
+                for cell in row
+                if cell.tag in ("th", "td")
+            ]
+            if cells:
+                rows.append(cells)
+        if not rows:
+            return None
+        width: int = max(len(row) for row in rows)
+        rows = [row + [""] * (width - len(row)) for row in rows]
+        lines: List[str] = [
+            "| " + " | ".join(rows[0]) + " |",
+            "|" + " --- |" * width,
+        ]
+        lines += ["| " + " | ".join(row) + " |" for row in rows[1:]]
+        return "\n".join(lines)
+
+    def inline_children(self, element: "HtmlElement") -> str:
+        parts: List[str] = [_WHITESPACE.sub(" ", element.text or "")]
+        for child in element:
+            if isinstance(child.tag, str) and child.tag not in _SKIP_TAGS:
+                parts.append(self.inline(child))
+            parts.append(_WHITESPACE.sub(" ", child.tail or ""))
+        return "".join(parts)
+
+    def inline(self, element: "HtmlElement") -> str:
+        tag: str = element.tag
+        if tag == "br":
+            return "\n"
+        if tag == "img":
+            return self.image(element)
+        if tag == "audio":
+            return self.audio_element(element)
+        inner: str = self.inline_children(element)
+        if tag == "a":
+            return self.link(element, inner)
+        if not inner.strip():
+            return inner
+        if tag in ("strong", "b"):
+            return f"**{inner.strip()}**"
+        if tag in ("em", "i"):
+            return f"*{inner.strip()}*"
+        if tag == "code":
+            return f"`{inner.strip()}`"
+        if tag in _BLOCK_TAGS:
+            return f" {inner} "
+        return inner
+
+    def link(self, element: "HtmlElement", inner: str) -> str:
+        text: str = _WHITESPACE.sub(" ", inner).strip()
+        href: Optional[str] = element.get("href")
+        if not href:
+            return inner
+        url: str = urljoin(self.base_url, href)
+        if url.lower().endswith(AUDIO_EXTENSIONS):
+            return self.media(self.audio, "audio", url, text, f"[{text or url}]({url})")
+        self.links.append({"text": text, "href": href, "url": url})
+        if not text or href.startswith(("#", "javascript:")):
+            return inner
+        return f"[{text}]({url})"
+
+    def image(self, element: "HtmlElement") -> str:
+        src: Optional[str] = element.get("src")
+        if not src:
+            return ""
+        url: str = urljoin(self.base_url, src)
+        alt: str = element.get("alt", "")
+        return self.media(self.images, "img", url, alt, f"![{alt}]({url})")
+
+    def audio_element(self, element: "HtmlElement") -> str:
+        src: Optional[str] = element.get("src") or next(
+            (
+                source.get("src")
+                for source in element.iter("source")
+                if source.get("src")
+            ),
+            None,
+        )
+        if not src:
+            return ""
+        url: str = urljoin(self.base_url, src)
+        return self.media(self.audio, "audio", url, "", f"[audio]({url})")
+
+    def media(
+        self,
+        inventory: List[Dict[str, str]],
+        placeholder: str,
+        url: str,
+        text: str,
+        markdown: str,
+    ) -> str:
+        name: str = os.path.basename(url)
+        inventory.append({"url": url, "name": name, "text": text})
+        if self.media_placeholders:
+            return f"<{placeholder}>{name}</{placeholder}>"
+        return markdown
+
+
+def html_to_markdown(
+    html: Union[str, bytes],
+    base_url: str = "",
+    media_placeholders: bool = False,
+) -> Dict[str, Any]:
+    """
+    Converts an HTML page to Markdown with lxml, keeping headings, lists,
+    tables, emphasis, code and links. Scripts, styles and <head> are dropped.
+    Args:
+        html (Union[str, bytes]): Page source; pass bytes to let lxml honour
+            the page's declared encoding.
+        base_url (str): URL the page came from, used to resolve relative links.
+        media_placeholders (bool): Render images as <img>name</img> and audio
+            as <audio>name</audio> instead of Markdown, for pipelines that
+            substitute descriptions or transcripts later.
+    Returns:
+        Dict[str, Any]: "markdown", plus "links" (text, href as written and
+        absolute url), "images" and "audio" (url, file name and alt/link text),
+        in document order.
+    """
+    from lxml import etree
+    from lxml.html import document_fromstring
+
+    renderer = _MarkdownRenderer(base_url, media_placeholders)
+    blocks: List[str] = []
+    if isinstance(html, str):
+        # lxml refuses str input that carries an XML encoding declaration.
+        html = html.encode("utf-8") if html.lstrip().startswith("<?xml") else html
+    try:
+        root = document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        root = None
+    if root is not None:
+        body = root.find("body")
+        renderer.blocks(body if body is not None else root, blocks)
+    return {
+        "markdown": "\n\n".join(blocks),
+        "links": renderer.links,
+        "images": renderer.images,
+        "audio": renderer.audio,
+    }
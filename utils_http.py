@@ -0,0 +1,128 @@
+import os
+import random
+import threading
+import time
+import requests
+from collections import defaultdict, deque
+from loguru import logger
+from requests.adapters import HTTPAdapter
+from typing import Any, Deque, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from utils_replay import replayable
+
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+Timeout = Union[float, Tuple[float, float]]
+
+
+class HttpClient:
+    """
+    Shared requests.Session with keep-alive pooling, default timeouts and
+    retries with full-jitter exponential backoff on connection errors and
+    429/5xx responses. Latency is recorded per endpoint (method, host, path).
+    """
+
+    def __init__(
+        self,
+        timeout: Timeout = (5.0, 60.0),
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        pool_maxsize: int = 32,
+        latency_window: int = 1000,
+    ):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._latencies: Dict[str, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=latency_window)
+        )
+        self._lock = threading.Lock()
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        retry_after: Optional[str] = (
+            response.headers.get("Retry-After") if response is not None else None
+        )
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    @replayable("http", ignore=("self", "timeout", "stream", "max_retries"))
+    def request(
+        self, method: str, url: str, max_retries: Optional[int] = None, **kwargs: Any
+    ) -> requests.Response:
+        """
+        Sends a request through the session. `max_retries` overrides the
+        client's retry count for this call, e.g. 0 when the caller has its
+        own time budget.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        if max_retries is None:
+            max_retries = self.max_retries
+        parts = urlsplit(url)
+        endpoint: str = f"{method.upper()} {parts.netloc}{parts.path}"
+        attempt: int = 0
+        while True:
+            response: Optional[requests.Response] = None
+            start: float = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= max_retries:
+                    raise
+                logger.warning(f"{endpoint} failed ({e}), retrying")
+            finally:
+                self._record(endpoint, time.perf_counter() - start)
+            if response is not None:
+                if (
+                    response.status_code not in RETRY_STATUS_CODES
+                    or attempt >= max_retries
+                ):
+                    return response
+                logger.warning(f"{endpoint} returned {response.status_code}, retrying")
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def _record(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies[endpoint].append(seconds)
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns count, mean, p50, p95 and max latency in seconds per endpoint,
+        over the most recent `latency_window` requests to each.
+        """
+        with self._lock:
+            samples = {endpoint: sorted(v) for endpoint, v in self._latencies.items()}
+        return {
+            endpoint: {
+                "count": len(values),
+                "mean": sum(values) / len(values),
+                "p50": values[int(0.5 * (len(values) - 1))],
+                "p95": values[int(0.95 * (len(values) - 1))],
+                "max": values[-1],
+            }
+            for endpoint, values in samples.items()
+            if values
+        }
+
+
+http_client = HttpClient(
+    timeout=(
+        float(os.getenv("HTTP_CONNECT_TIMEOUT", 5)),
+        float(os.getenv("HTTP_READ_TIMEOUT", 60)),
+    ),
+    max_retries=int(os.getenv("HTTP_MAX_RETRIES", 4)),
+)
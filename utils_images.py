@@ -0,0 +1,135 @@
+import io
+import math
+from loguru import logger
+from PIL import Image
+from typing import Any, Dict, Literal, Optional, Tuple
+
+
+_MAGIC_NUMBERS: Tuple[Tuple[bytes, str], ...] = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+# Running totals for the current process, see preprocessing_stats().
+_totals: Dict[str, int] = {
+    "images": 0,
+    "original_bytes": 0,
+    "bytes": 0,
+    "original_tokens": 0,
+    "tokens": 0,
+}
+
+
+def detect_image_mime(data: bytes) -> str:
+    """
+    Detects the image type from its magic number, defaulting to JPEG.
+    """
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, mime in _MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return mime
+    return "image/jpeg"
+
+
+def estimate_image_tokens(
+    width: int, height: int, detail: Literal["low", "high"] = "high"
+) -> int:
+    """
+    Estimates input tokens for an image using OpenAI's tiling rules: the image
+    is fitted into 2048x2048, its short side scaled to 768, then billed as 85
+    base tokens plus 170 per 512px tile.
+    """
+    if detail == "low":
+        return 85
+    width, height = _fit(width, height, 2048)
+    scale: float = min(1.0, 768 / min(width, height))
+    width, height = int(width * scale), int(height * scale)
+    tiles: int = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * tiles
+
+
+def _fit(width: int, height: int, long_edge: int) -> Tuple[int, int]:
+    scale: float = min(1.0, long_edge / max(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def preprocess_image(
+    data: bytes,
+    max_long_edge: int = 1536,
+    max_tiles: Optional[int] = None,
+    output_format: Literal["JPEG", "PNG", "WEBP"] = "JPEG",
+    quality: int = 85,
+    detail: Literal["auto", "low", "high"] = "auto",
+) -> Dict[str, Any]:
+    """
+    Downscales and re-encodes an image before it is sent to a vision model.
+    Args:
+        data (bytes): Original image bytes.
+        max_long_edge (int): Longest allowed side in pixels after resizing.
+        max_tiles (Optional[int]): If set, keep shrinking until the image fits in this
+            many 512px tiles.
+        output_format (str): Pillow format to re-encode to. Images with transparency
+            fall back to PNG when JPEG is requested.
+        quality (int): Encoder quality for lossy formats.
+        detail (str): OpenAI detail level. "auto" picks "low" when the resized
+            image fits into a single 512x512 tile.
+    Returns:
+        Dict[str, Any]: "data", "mime_type", "detail" and byte/token counts before
+            and after preprocessing. The original bytes are kept if re-encoding
+            does not make the image smaller.
+    """
+    image: Image.Image = Image.open(io.BytesIO(data))
+    original_size: Tuple[int, int] = image.size
+    width, height = _fit(*original_size, max_long_edge)
+    while max_tiles and estimate_image_tokens(width, height) > 85 + 170 * max_tiles:
+        width, height = _fit(width, height, int(max(width, height) * 0.9))
+    if (width, height) != original_size:
+        image = image.resize((width, height), Image.LANCZOS)
+
+    has_alpha: bool = image.mode in ("RGBA", "LA") or "transparency" in image.info
+    target_format: str = (
+        "PNG" if has_alpha and output_format == "JPEG" else output_format
+    )
+    if target_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=target_format, quality=quality, optimize=True)
+    processed: bytes = buffer.getvalue()
+
+    if detail == "auto":
+        detail = "low" if max(width, height) <= 512 else "high"
+    result: Dict[str, Any] = {
+        "data": processed,
+        "mime_type": Image.MIME[target_format],
+        "detail": detail,
+        "original_bytes": len(data),
+        "bytes": len(processed),
+        "original_tokens": estimate_image_tokens(*original_size),
+        "tokens": estimate_image_tokens(width, height, detail),
+    }
+    if len(processed) >= len(data) and (width, height) == original_size:
+        result.update(data=data, mime_type=detect_image_mime(data), bytes=len(data))
+    for name in ("original_bytes", "bytes", "original_tokens", "tokens"):
+        _totals[name] += result[name]
+    _totals["images"] += 1
+    logger.debug(
+        f"Image {original_size[0]}x{original_size[1]} -> {width}x{height} ({detail}): "
+        f"{result['original_bytes']} -> {result['bytes']} bytes, "
+        f"~{result['original_tokens']} -> ~{result['tokens']} tokens"
+    )
+    return result
+
+
+def preprocessing_stats() -> Dict[str, int]:
+    """
+    Returns totals over every image preprocessed in this process, including
+    bytes and estimated image tokens saved.
+    """
+    return {
+        **_totals,
+        "bytes_saved": _totals["original_bytes"] - _totals["bytes"],
+        "tokens_saved": _totals["original_tokens"] - _totals["tokens"],
+    }
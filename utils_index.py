@@ -0,0 +1,165 @@
+import os
+from collections import defaultdict
+from loguru import logger
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils_cache import SqliteCache, hash_file, make_cache_key
+
+
+DEFAULT_FILE_TYPES: Dict[str, str] = {
+    ".png": "Images",
+    ".mp3": "Audio",
+    ".txt": "Text",
+}
+
+
+def scan_files(
+    directory: str,
+    file_types: Dict[str, str] = DEFAULT_FILE_TYPES,
+    recursive: bool = True,
+) -> Dict[str, Tuple[int, int]]:
+    """
+    Lists files with one of the `file_types` extensions under `directory`.
+    Hidden files and directories (such as in-progress downloads) are skipped.
+    Returns:
+        Dict[str, Tuple[int, int]]: (size, mtime_ns) per path relative to
+        `directory`, taken from os.scandir without extra stat calls on Linux.
+    """
+    files: Dict[str, Tuple[int, int]] = {}
+    pending: List[str] = [""]
+    while pending:
+        relative_dir: str = pending.pop()
+        with os.scandir(os.path.join(directory, relative_dir)) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                relative_path: str = os.path.join(relative_dir, entry.name)
+                if entry.is_dir():
+                    if recursive:
+                        pending.append(relative_path)
+                elif os.path.splitext(entry.name)[1] in file_types and entry.is_file():
+                    stat = entry.stat()
+                    files[relative_path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+class FileIndex:
+    """
+    Persisted manifest of a directory tree (size, mtime and SHA-256 per file)
+    that reports which files are new or changed since the last commit().
+
+    Files whose size and mtime are unchanged are not re-read; touched files
+    whose content hash is unchanged are not reported. Each index is named
+    after the pipeline using it, so several pipelines can track the same
+    directory independently. A pipeline can attach one result per file with
+    set_result(); it is kept until the file's content changes.
+
+    The manifest lives in FILE_INDEX_PATH (default .cache/file_index.sqlite).
+    Setting it to an empty string turns indexing off: every scan() then
+    reports every file and commit() saves nothing.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        file_types: Dict[str, str] = DEFAULT_FILE_TYPES,
+        recursive: bool = True,
+        manifest_path: Optional[str] = None,
+    ):
+        self.directory = directory
+        self.file_types = file_types
+        self.recursive = recursive
+        path: str = (
+            manifest_path
+            if manifest_path is not None
+            else os.getenv("FILE_INDEX_PATH", ".cache/file_index.sqlite")
+        )
+        self.store: Optional[SqliteCache] = (
+            SqliteCache(path, namespace="file_index") if path else None
+        )
+        self._key: str = make_cache_key(
+            name, os.path.abspath(directory), file_types, recursive
+        )
+        self.manifest: Dict[str, Dict[str, Any]] = (
+            (self.store.get(self._key) or {}) if self.store is not None else {}
+        )
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.removed: List[str] = []
+
+    def scan(self) -> Dict[str, List[str]]:
+        """
+        Scans the directory against the manifest. After this, `entries` holds
+        every current file and `removed` the files that disappeared.
+        Returns:
+            Dict[str, List[str]]: New or changed paths (relative to the
+            directory, sorted) grouped by file type.
+        """
+        changed: Dict[str, List[str]] = defaultdict(list)
+        self.entries = {}
+        for path, (size, mtime_ns) in sorted(
+            scan_files(self.directory, self.file_types, self.recursive).items()
+        ):
+            previous: Optional[Dict[str, Any]] = self.manifest.get(path)
+            if (
+                previous is not None
+                and previous["size"] == size
+                and previous["mtime_ns"] == mtime_ns
+            ):
+                self.entries[path] = previous
+                continue
+            sha256: str = hash_file(os.path.join(self.directory, path))
+            unchanged: bool = previous is not None and previous["sha256"] == sha256
+            self.entries[path] = {
+                "size": size,
+                "mtime_ns": mtime_ns,
+                "sha256": sha256,
+                "result": previous["result"] if unchanged else None,
+            }
+            if not unchanged:
+                changed[self.file_types[os.path.splitext(path)[1]]].append(path)
+        self.removed = sorted(set(self.manifest) - set(self.entries))
+        logger.info(
+            f"Indexed {self.directory}: {len(self.entries)} files, "
+            f"{sum(len(paths) for paths in changed.values())} new or changed, "
+            f"{len(self.removed)} removed"
+        )
+        return changed
+
+    def files(self) -> Dict[str, List[str]]:
+        """
+        Returns all files seen by the last scan() grouped by type, like
+        group_files_by_type.
+        """
+        grouped: Dict[str, List[str]] = defaultdict(list)
+        for path in self.entries:
+            grouped[self.file_types[os.path.splitext(path)[1]]].append(path)
+        return grouped
+
+    def result(self, path: str) -> Any:
+        return self.entries[path]["result"]
+
+    def set_result(self, path: str, result: Any) -> None:
+        self.entries[path]["result"] = result
+
+    def discard(self, path: str) -> None:
+        """
+        Leaves a file out of the next commit(), so it is reported again.
+        """
+        self.entries.pop(path, None)
+
+    def reset(self) -> None:
+        """
+        Forgets the manifest, so the next scan() reports every file; for when
+        whatever was built from earlier scans has been lost.
+        """
+        self.manifest = {}
+
+    def commit(self) -> None:
+        """
+        Saves the last scan() as the manifest. Call it once the changes have
+        been processed, so a failed run reports them again.
+        """
+        if self.store is not None:
+            self.store.set(self._key, self.entries)
+        self.manifest = self.entries
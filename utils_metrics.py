@@ -0,0 +1,368 @@
+import asyncio
+import atexit
+import functools
+import inspect
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from loguru import logger
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# USD per 1M tokens ("input", "cached_input", "output") or per image ("image").
+# Models missing here (e.g. local Ollama ones) are treated as free.
+PRICES: Dict[str, Dict[str, float]] = {
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "text-embedding-3-small": {"input": 0.02},
+    "text-embedding-3-large": {"input": 0.13},
+    "text-embedding-ada-002": {"input": 0.10},
+    "dall-e-3": {"image": 0.04},
+    "dall-e-2": {"image": 0.02},
+}
+
+SECONDS_BUCKETS: Tuple[float, ...] = (
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+    math.inf,
+)
+
+_COUNTERS: Tuple[str, ...] = (
+    "calls",
+    "cache_hits",
+    "errors",
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_tokens",
+    "images",
+    "cost_usd",
+)
+
+
+def estimate_cost(
+    model: str,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    cached_tokens: int = 0,
+    images: int = 0,
+) -> float:
+    price: Dict[str, float] = PRICES.get(model, {})
+    uncached_tokens: int = prompt_tokens - cached_tokens
+    return (
+        uncached_tokens * price.get("input", 0.0)
+        + cached_tokens * price.get("cached_input", price.get("input", 0.0))
+        + completion_tokens * price.get("output", 0.0)
+    ) / 1_000_000 + images * price.get("image", 0.0)
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = SECONDS_BUCKETS):
+        self.buckets = buckets
+        self.counts: List[int] = [0] * len(buckets)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        total: int = 0
+        result: List[Tuple[float, int]] = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "buckets": {
+                ("+Inf" if math.isinf(bound) else str(bound)): count
+                for bound, count in self.cumulative()
+            },
+        }
+
+
+class MetricsRegistry:
+    """
+    In-process metrics for LLM calls, labelled by call site and model: wall
+    time and time-to-first-byte histograms plus token, cost, cache-hit and
+    error counters. Nothing leaves the process unless dumped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._durations: Dict[Tuple[str, str], _Histogram] = defaultdict(_Histogram)
+            self._ttfb: Dict[Tuple[str, str], _Histogram] = defaultdict(_Histogram)
+            self._counters: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(
+                lambda: dict.fromkeys(_COUNTERS, 0)
+            )
+
+    def record(self, call: Dict[str, Any]) -> None:
+        labels: Tuple[str, str] = (call["call_site"], call["model"])
+        cost: float = estimate_cost(
+            call["model"],
+            call["prompt_tokens"],
+            call["completion_tokens"],
+            call["cached_tokens"],
+            call["images"],
+        )
+        with self._lock:
+            self._durations[labels].observe(call["seconds"])
+            if call["ttfb_seconds"] is not None:
+                self._ttfb[labels].observe(call["ttfb_seconds"])
+            counters = self._counters[labels]
+            # A wrapper around other metered calls (openai_get_embeddings
+            # running openai_aget_embeddings) is timed, but only the innermost
+            # calls are counted, so one request is one call.
+            if not call["nested"]:
+                counters["calls"] += 1
+                counters["errors"] += int(call["error"])
+                # A call that finished without reaching the provider was
+                # served from one of the response caches.
+                counters["cache_hits"] += int(
+                    not call["requests"] and not call["error"]
+                )
+            for name in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+                counters[name] += call[name]
+            counters["images"] += call["images"]
+            counters["cost_usd"] += cost
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                f"{call_site}|{model}": {
+                    "call_site": call_site,
+                    "model": model,
+                    **self._counters[(call_site, model)],
+                    "duration_seconds": self._durations[(call_site, model)].to_dict(),
+                    "ttfb_seconds": (
+                        self._ttfb[(call_site, model)].to_dict()
+                        if (call_site, model) in self._ttfb
+                        else None
+                    ),
+                }
+                for call_site, model in sorted(self._counters)
+            }
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, histograms, help_text in (
+                ("llm_call_duration_seconds", self._durations, "Wall time per call."),
+                ("llm_call_ttfb_seconds", self._ttfb, "Time to first byte per call."),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (call_site, model), histogram in sorted(histograms.items()):
+                    labels = f'call_site="{call_site}",model="{model}"'
+                    for bound, count in histogram.cumulative():
+                        le = "+Inf" if math.isinf(bound) else repr(bound)
+                        lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+                    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+            for counter in _COUNTERS:
+                name = f"llm_{counter}_total"
+                lines.append(f"# TYPE {name} counter")
+                for (call_site, model), counters in sorted(self._counters.items()):
+                    labels = f'call_site="{call_site}",model="{model}"'
+                    lines.append(f"{name}{{{labels}}} {counters[counter]}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """
+        Writes Prometheus text format for *.prom files and JSON otherwise.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            if path.endswith(".prom"):
+                file.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), file, indent=2)
+        logger.info(f"LLM metrics written to {path}")
+
+
+llm_metrics = MetricsRegistry()
+
+_current_call: ContextVar[Optional[Dict[str, Any]]] = ContextVar(
+    "llm_current_call", default=None
+)
+
+
+def record_usage(
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    cached_tokens: int = 0,
+    images: int = 0,
+) -> None:
+    """
+    Adds provider-reported usage to the innermost metered call, if any. Called
+    only where a request actually went out, so cache hits record nothing.
+    """
+    call: Optional[Dict[str, Any]] = _current_call.get()
+    if call is None:
+        return
+    # Enclosing metered calls did reach the provider too, but the tokens are
+    # attributed to the innermost call only so totals are not double counted.
+    parent: Optional[Dict[str, Any]] = call
+    while parent is not None:
+        parent["requests"] += 1
+        parent = parent["parent"]
+    call["prompt_tokens"] += prompt_tokens or 0
+    call["completion_tokens"] += completion_tokens or 0
+    call["cached_tokens"] += cached_tokens or 0
+    call["images"] += images
+
+
+def record_ttfb(seconds: float) -> None:
+    _set_ttfb(_current_call.get(), seconds)
+
+
+def _set_ttfb(call: Optional[Dict[str, Any]], seconds: float) -> None:
+    while call is not None and call["ttfb_seconds"] is None:
+        call["ttfb_seconds"] = seconds
+        call = call["parent"]
+
+
+def record_error() -> None:
+    call: Optional[Dict[str, Any]] = _current_call.get()
+    if call is not None:
+        call["error"] = True
+
+
+def _new_call(call_site: str, model: str) -> Dict[str, Any]:
+    parent: Optional[Dict[str, Any]] = _current_call.get()
+    if parent is not None:
+        parent["nested"] += 1
+    return {
+        "call_site": call_site,
+        "model": model,
+        "seconds": 0.0,
+        "ttfb_seconds": None,
+        "requests": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "images": 0,
+        "error": False,
+        "nested": 0,
+        "parent": parent,
+    }
+
+
+def metered(call_site: str) -> Callable:
+    """
+    Records every call of the decorated function into `llm_metrics` under
+    `call_site` and the call's `model` argument. Works for plain functions,
+    coroutines and generators; for generators the first yielded chunk is the
+    time to first byte.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        signature = inspect.signature(function)
+
+        def _model(args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> str:
+            bound = signature.bind_partial(*args, **kwargs)
+            bound.apply_defaults()
+            return str(bound.arguments.get("model", "unknown"))
+
+        def _finish(call: Dict[str, Any], start: float) -> None:
+            call["seconds"] = time.perf_counter() - start
+            llm_metrics.record(call)
+
+        if inspect.isgeneratorfunction(function):
+
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                call = _new_call(call_site, _model(args, kwargs))
+                start: float = time.perf_counter()
+                chunks = function(*args, **kwargs)
+                try:
+                    while True:
+                        # The call is current only while the generator body
+                        # runs, not while the consumer holds a chunk.
+                        token = _current_call.set(call)
+                        try:
+                            chunk = next(chunks)
+                        except StopIteration:
+                            return
+                        finally:
+                            _current_call.reset(token)
+                        _set_ttfb(call, time.perf_counter() - start)
+                        yield chunk
+                except Exception:
+                    call["error"] = True
+                    raise
+                finally:
+                    chunks.close()
+                    _finish(call, start)
+
+            return generator_wrapper
+
+        if asyncio.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                call = _new_call(call_site, _model(args, kwargs))
+                token = _current_call.set(call)
+                start: float = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                except Exception:
+                    call["error"] = True
+                    raise
+                finally:
+                    _current_call.reset(token)
+                    _finish(call, start)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            call = _new_call(call_site, _model(args, kwargs))
+            token = _current_call.set(call)
+            start: float = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                call["error"] = True
+                raise
+            finally:
+                _current_call.reset(token)
+                _finish(call, start)
+
+        return wrapper
+
+    return decorator
+
+
+# Set LLM_METRICS_PATH (e.g. .cache/llm_metrics.prom or .json) to dump the
+# registry when the process exits.
+if os.getenv("LLM_METRICS_PATH"):
+    atexit.register(llm_metrics.dump, os.getenv("LLM_METRICS_PATH"))
@@ -1,21 +1,59 @@
 import os
 
-from neo4j import GraphDatabase
-from typing import List
+from typing import TYPE_CHECKING, Any, Callable, List
 
+from utils_replay import replay_mode, replayable
+
+if TYPE_CHECKING:
+    from neo4j import GraphDatabase
+
+
+class _ReplaySession:
+    """
+    Stands in for a session while replaying, so transaction functions run
+    against the cassette instead of opening a connection.
+    """
+
+    def __enter__(self) -> "_ReplaySession":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+    def write_transaction(self, function: Callable, *args: Any, **kwargs: Any) -> Any:
+        return function(None, *args, **kwargs)
+
+    read_transaction = execute_read = execute_write = write_transaction
+
+
+class _ReplayDriver:
+    def session(self, **kwargs: Any) -> _ReplaySession:
+        return _ReplaySession()
+
+    def close(self) -> None:
+        pass
+
+
+def create_driver() -> "GraphDatabase.driver":
+    if replay_mode() == "replay":
+        return _ReplayDriver()
+    from neo4j import GraphDatabase
 
-def create_driver() -> GraphDatabase.driver:
     uri = os.getenv("NEO4J_URI")
     username = os.getenv("NEO4J_USERNAME")
     password = os.getenv("NEO4J_PASSWORD")
     return GraphDatabase.driver(uri, auth=(username, password))
 
 
-def close_connection(driver: GraphDatabase.driver) -> None:
+def close_connection(driver: "GraphDatabase.driver") -> None:
     driver.close()
 
 
 # TODO: Functions are not generic.
+@replayable("neo4j.add_person", ignore=("tx",))
 def add_person(tx, person_id, name) -> None:
     query = """
     MERGE (p:Person {id: $id})
@@ -24,6 +62,7 @@ def add_person(tx, person_id, name) -> None:
     tx.run(query, id=person_id, name=name)
 
 
+@replayable("neo4j.add_relationship", ignore=("tx",))
 def add_relationship(tx, id1, id2) -> None:
     query = """
     MATCH (p1:Person {id: $id1}), (p2:Person {id: $id2})
@@ -32,6 +71,7 @@ def add_relationship(tx, id1, id2) -> None:
     tx.run(query, id1=id1, id2=id2)
 
 
+@replayable("neo4j.find_shortest_path", ignore=("session",))
 def find_shortest_path(session, start_name: str, end_name: str) -> List:
     query = """
         MATCH (start:Person {name: $start_name}), (end:Person {name: $end_name}),
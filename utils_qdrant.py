@@ -1,23 +1,43 @@
 # import os
 
 from loguru import logger
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-from typing import Any, Dict, List
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 from utils_ai import openai_get_embedding
+from utils_replay import replayable
 
+if TYPE_CHECKING:
+    from qdrant_client import QdrantClient
 
-client = QdrantClient(host="localhost", port=6333)
-# client = QdrantClient(
-#     url=os.getenv("QDRANT_URL"),
-#     api_key=os.getenv("QDRANT_URL"),
-# )
 
+# Created on first use, so importing this module neither loads qdrant_client
+# nor needs a running Qdrant. Assign a client here to use another instance.
+client: Optional["QdrantClient"] = None
 
+
+def _qdrant_client() -> "QdrantClient":
+    global client
+    if client is None:
+        from qdrant_client import QdrantClient
+
+        client = QdrantClient(host="localhost", port=6333)
+        # client = QdrantClient(
+        #     url=os.getenv("QDRANT_URL"),
+        #     api_key=os.getenv("QDRANT_URL"),
+        # )
+    return client
+
+
+@replayable("qdrant_create_collection")
 def qdrant_create_collection(
-    collection_name: str, size: int = 1536, distance=Distance.COSINE
-):
+    collection_name: str, size: int = 1536, distance="Cosine"  # Distance.COSINE
+) -> bool:
+    """
+    Creates the collection unless it exists. Returns True if it was created.
+    """
+    from qdrant_client.models import VectorParams
+
+    client = _qdrant_client()
     existing_collections: List[str] = [
         col.name for col in client.get_collections().collections
     ]
@@ -27,31 +47,71 @@ def qdrant_create_collection(
             vectors_config=VectorParams(size=size, distance=distance),
         )
         logger.debug(f"Successfully created collection: {collection_name}")
-    else:
-        logger.debug(f"Collection: {collection_name} already exists.")
+        return True
+    logger.debug(f"Collection: {collection_name} already exists.")
+    return False
 
 
+@replayable("qdrant_upsert")
 def qdrant_upsert(
     collection_name: str,
     unique_id: str,
     embedding: List[float],
     payload: Dict[str, Any],
-):
+) -> bool:
+    """
+    Adds or replaces one point. Returns False if Qdrant rejected it.
+    """
+    from qdrant_client.models import PointStruct
+
     try:
-        client.upsert(
+        _qdrant_client().upsert(
             collection_name=collection_name,
             points=[PointStruct(id=unique_id, vector=embedding, payload=payload)],
         )
         logger.success(f"Successfully added {unique_id} to {collection_name}.")
+        return True
     except Exception as e:
         logger.error(f"Error adding {unique_id} to {collection_name}.\n{e}")
+        return False
+
 
+@replayable("qdrant_delete")
+def qdrant_delete(collection_name: str, unique_ids: List[str]) -> bool:
+    """
+    Removes the points. Returns False if Qdrant rejected the request.
+    """
+    from qdrant_client.models import PointIdsList
 
+    if not unique_ids:
+        return True
+    try:
+        _qdrant_client().delete(
+            collection_name=collection_name,
+            points_selector=PointIdsList(points=unique_ids),
+        )
+        logger.success(f"Removed {len(unique_ids)} points from {collection_name}.")
+        return True
+    except Exception as e:
+        logger.error(f"Error removing points from {collection_name}.\n{e}")
+        return False
+
+
+@replayable("qdrant_search")
 def qdrant_search(collection_name: str, query_vector: List[float], top_k: int):
-    return client.search(
-        collection_name=collection_name,
-        query_vector=query_vector,
-        limit=top_k,
+    """
+    Returns the `top_k` closest points, best first, with their payloads.
+    Uses query_points; QdrantClient.search is gone from current clients.
+    """
+    return (
+        _qdrant_client()
+        .query_points(
+            collection_name=collection_name,
+            query=query_vector,
+            limit=top_k,
+            with_payload=True,
+        )
+        .points
     )
 
 
@@ -62,8 +122,4 @@ def query_similar_text(
     embedding_model: str = "text-embedding-3-small",
 ):
     query_vector = openai_get_embedding(query_text, model=embedding_model)
-    return client.search(
-        collection_name=collection_name,
-        query_vector=query_vector,
-        limit=top_k,
-    )
+    return qdrant_search(collection_name, query_vector, top_k)
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from loguru import logger
+from typing import Dict, Optional, Tuple
+
+
+class RateLimiter:
+    """
+    Token buckets for requests-per-minute and tokens-per-minute per model.
+
+    Bucket state lives in a SQLite file and is updated inside write
+    transactions, so concurrently running episode processes share one budget.
+    Models without configured limits are never throttled.
+    """
+
+    def __init__(self, path: str, limits: Dict[str, Dict[str, float]]):
+        self.path = path
+        self.limits = limits
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS buckets (
+                    model TEXT PRIMARY KEY,
+                    requests REAL NOT NULL,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _capacity(
+        self, model: str
+    ) -> Optional[Tuple[Optional[float], Optional[float]]]:
+        """
+        Returns the model's (rpm, tpm), with None for a limit that is not
+        configured, or None when the model has no limits at all.
+        """
+        limit: Optional[Dict[str, float]] = self.limits.get(model)
+        if limit is None:
+            return None
+        rpm: Optional[float] = float(limit["rpm"]) if "rpm" in limit else None
+        tpm: Optional[float] = float(limit["tpm"]) if "tpm" in limit else None
+        if rpm is None and tpm is None:
+            return None
+        return rpm, tpm
+
+    def _try_acquire(self, model: str, tokens: int) -> float:
+        """
+        Takes one request and `tokens` tokens from the model's buckets if both
+        have enough. Returns 0.0 on success, otherwise the seconds to wait.
+        Only configured limits are checked; an unconfigured bucket stays at 0.
+        """
+        capacity = self._capacity(model)
+        if capacity is None:
+            return 0.0
+        rpm, tpm = capacity
+        if tpm is not None:
+            tokens = min(tokens, tpm)
+        now: float = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT requests, tokens, updated_at FROM buckets WHERE model = ?",
+                (model,),
+            ).fetchone()
+            available_requests, available_tokens, updated_at = row or (
+                rpm or 0.0,
+                tpm or 0.0,
+                now,
+            )
+            elapsed: float = max(0.0, now - updated_at)
+            wait: float = 0.0
+            if rpm is not None:
+                available_requests = min(rpm, available_requests + elapsed * rpm / 60)
+                wait = max(wait, (1 - available_requests) * 60 / rpm)
+            if tpm is not None:
+                available_tokens = min(tpm, available_tokens + elapsed * tpm / 60)
+                wait = max(wait, (tokens - available_tokens) * 60 / tpm)
+            if wait == 0.0:
+                if rpm is not None:
+                    available_requests -= 1
+                if tpm is not None:
+                    available_tokens -= tokens
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (model, requests, tokens, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (model, available_requests, available_tokens, now),
+            )
+            conn.execute("COMMIT")
+        return wait
+
+    def acquire(self, model: str, tokens: int) -> None:
+        while (wait := self._try_acquire(model, tokens)) > 0:
+            logger.debug(f"Rate limit for {model}: waiting {wait:.2f}s")
+            time.sleep(wait)
+
+    async def aacquire(self, model: str, tokens: int) -> None:
+        # The bucket transaction can block on the SQLite lock for up to the
+        # busy timeout, so it runs off the event loop.
+        while (wait := await asyncio.to_thread(self._try_acquire, model, tokens)) > 0:
+            logger.debug(f"Rate limit for {model}: waiting {wait:.2f}s")
+            await asyncio.sleep(wait)
+
+    def adjust(self, model: str, estimated_tokens: int, actual_tokens: int) -> None:
+        """
+        Corrects the token bucket once the real usage is known. Underestimates
+        leave the bucket in debt, which delays the following requests.
+        """
+        if self._capacity(model) is None or estimated_tokens == actual_tokens:
+            return
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE buckets SET tokens = tokens - ? WHERE model = ?",
+                (actual_tokens - estimated_tokens, model),
+            )
+
+
+def rate_limiter_from_env() -> Optional[RateLimiter]:
+    """
+    Builds the shared limiter from OPENAI_RATE_LIMITS, a JSON object such as
+    {"gpt-4o-mini": {"rpm": 500, "tpm": 200000}}. The bucket state file is
+    RATE_LIMIT_STATE_PATH (default .cache/rate_limits.sqlite).
+    """
+    limits: Optional[str] = os.getenv("OPENAI_RATE_LIMITS")
+    if not limits:
+        return None
+    return RateLimiter(
+        os.getenv("RATE_LIMIT_STATE_PATH", ".cache/rate_limits.sqlite"),
+        json.loads(limits),
+    )
@@ -0,0 +1,212 @@
+import asyncio
+import functools
+import inspect
+import os
+import pickle
+import threading
+import time
+from collections import defaultdict
+from loguru import logger
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional, Tuple
+
+from utils_cache import SqliteCache, make_cache_key
+
+
+class ReplayMissError(LookupError):
+    pass
+
+
+class Cassette:
+    """
+    Recorded outbound calls, keyed by call name, arguments and occurrence.
+
+    In "record" mode calls go out as usual and their results (or raised
+    exceptions) are stored with the time they took. In "replay" mode nothing
+    goes out: the n-th identical call gets the n-th recorded result, falling
+    back to the first one when the run makes more calls than were recorded.
+    With `latency_scale` > 0 a replayed call sleeps for its recorded duration
+    times the scale, which approximates the original run's timing.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: Literal["record", "replay"],
+        latency_scale: float = 0.0,
+    ):
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.store = SqliteCache(path, namespace="cassette")
+        self._occurrences: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _next_key(self, name: str, key_parts: List[Any]) -> Tuple[str, int]:
+        base: str = make_cache_key(name, *key_parts)
+        with self._lock:
+            occurrence: int = self._occurrences[base]
+            self._occurrences[base] += 1
+        return base, occurrence
+
+    def _lookup(self, name: str, base: str, occurrence: int) -> Dict[str, Any]:
+        entry: Optional[Dict[str, Any]] = self.store.get(f"{base}:{occurrence}")
+        if entry is None and occurrence:
+            entry = self.store.get(f"{base}:0")
+        if entry is None:
+            raise ReplayMissError(f"No recording for {name} ({base[:12]})")
+        return entry
+
+    def _save(
+        self,
+        name: str,
+        key: str,
+        value: Any,
+        error: Optional[BaseException],
+        seconds: float,
+    ) -> None:
+        entry: Dict[str, Any] = {"value": value, "error": error, "seconds": seconds}
+        try:
+            self.store.set(key, entry)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            if error is None:
+                logger.warning(f"Could not record {name}: {e}")
+                return
+            # Some client exceptions hold sockets or locks; keep the message.
+            entry["error"] = RuntimeError(repr(error))
+            self.store.set(key, entry)
+
+    @staticmethod
+    def _result(entry: Dict[str, Any]) -> Any:
+        if entry["error"] is not None:
+            raise entry["error"]
+        return entry["value"]
+
+    def call(self, name: str, key_parts: List[Any], compute: Callable[[], Any]) -> Any:
+        base, occurrence = self._next_key(name, key_parts)
+        if self.mode == "replay":
+            entry = self._lookup(name, base, occurrence)
+            if self.latency_scale:
+                time.sleep(entry["seconds"] * self.latency_scale)
+            return self._result(entry)
+        start: float = time.perf_counter()
+        try:
+            value = compute()
+        except Exception as e:
+            self._save(
+                name, f"{base}:{occurrence}", None, e, time.perf_counter() - start
+            )
+            raise
+        self._save(
+            name, f"{base}:{occurrence}", value, None, time.perf_counter() - start
+        )
+        return value
+
+    async def acall(
+        self,
+        name: str,
+        key_parts: List[Any],
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        base, occurrence = self._next_key(name, key_parts)
+        if self.mode == "replay":
+            entry = self._lookup(name, base, occurrence)
+            if self.latency_scale:
+                await asyncio.sleep(entry["seconds"] * self.latency_scale)
+            return self._result(entry)
+        start: float = time.perf_counter()
+        try:
+            value = await compute()
+        except Exception as e:
+            self._save(
+                name, f"{base}:{occurrence}", None, e, time.perf_counter() - start
+            )
+            raise
+        self._save(
+            name, f"{base}:{occurrence}", value, None, time.perf_counter() - start
+        )
+        return value
+
+
+cassette: Optional[Cassette] = None
+
+
+def enable_replay(
+    mode: Literal["record", "replay"],
+    path: str = ".cache/cassette.sqlite",
+    latency_scale: float = 0.0,
+) -> Cassette:
+    global cassette
+    cassette = Cassette(path, mode, latency_scale)
+    logger.info(f"Replay mode {mode} with cassette {path}")
+    return cassette
+
+
+def disable_replay() -> None:
+    global cassette
+    cassette = None
+
+
+def replay_mode() -> Optional[str]:
+    return cassette.mode if cassette is not None else None
+
+
+def replayable(name: str, ignore: Tuple[str, ...] = ()) -> Callable:
+    """
+    Routes calls of the decorated function through the active cassette, if
+    any. The key is built from the bound arguments (with **kwargs flattened)
+    minus those named in `ignore`, such as clients, sessions or timeouts.
+    Sync and async functions sharing a `name` share recordings.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        signature = inspect.signature(function)
+
+        def _key_parts(args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> List[Any]:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments: Dict[str, Any] = {}
+            for parameter_name, value in bound.arguments.items():
+                if signature.parameters[parameter_name].kind is (
+                    inspect.Parameter.VAR_KEYWORD
+                ):
+                    arguments.update(value)
+                else:
+                    arguments[parameter_name] = value
+            return [
+                {key: value for key, value in arguments.items() if key not in ignore}
+            ]
+
+        if asyncio.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if cassette is None:
+                    return await function(*args, **kwargs)
+                return await cassette.acall(
+                    name,
+                    _key_parts(args, kwargs),
+                    lambda: function(*args, **kwargs),
+                )
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if cassette is None:
+                return function(*args, **kwargs)
+            return cassette.call(
+                name, _key_parts(args, kwargs), lambda: function(*args, **kwargs)
+            )
+
+        return wrapper
+
+    return decorator
+
+
+# REPLAY_MODE=record|replay turns the cassette on for the whole process.
+# REPLAY_LATENCY_SCALE=1 replays with the recorded timings, 0 as fast as possible.
+if os.getenv("REPLAY_MODE") in ("record", "replay"):
+    enable_replay(
+        os.getenv("REPLAY_MODE"),
+        os.getenv("REPLAY_CASSETTE", ".cache/cassette.sqlite"),
+        float(os.getenv("REPLAY_LATENCY_SCALE", 0)),
+    )
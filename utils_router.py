@@ -0,0 +1,227 @@
+import threading
+import time
+from loguru import logger
+from typing import Callable, Dict, List, Optional
+
+from utils_ai import LocalLLMError, generate_local_llm_response, openai_create
+from utils_hedging import CallPolicy, call_with_policy
+
+
+class Backend:
+    """
+    One way of answering a (system_template, human_template) prompt, together
+    with its observed latency and health. `call` also receives a timeout in
+    seconds (None for the backend's own) and should give up once it passes.
+
+    Latency is tracked as an exponentially weighted moving average. After
+    `max_failures` consecutive failures the backend is skipped for
+    `cooldown_seconds`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        call: Callable[[str, str, Optional[float]], str],
+        cost_per_1k_tokens: float = 0.0,
+        max_concurrency: Optional[int] = None,
+        ewma_alpha: float = 0.3,
+        max_failures: int = 2,
+        cooldown_seconds: float = 60.0,
+    ):
+        self.name = name
+        self.call = call
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+        self.max_concurrency = max_concurrency
+        self.ewma_alpha = ewma_alpha
+        self.max_failures = max_failures
+        self.cooldown_seconds = cooldown_seconds
+        self.latency_seconds: Optional[float] = None
+        self.in_flight: int = 0
+        self.failures: int = 0
+        self.unhealthy_until: float = 0.0
+        self._lock = threading.Lock()
+
+    def is_healthy(self) -> bool:
+        return time.time() >= self.unhealthy_until
+
+    def expected_latency(self) -> float:
+        """
+        Observed latency scaled by the queue in front of a concurrency-limited
+        backend, so a busy local model stops looking fast under load.
+        """
+        if self.latency_seconds is None:
+            return 0.0
+        if self.max_concurrency is None:
+            return self.latency_seconds
+        queued_rounds: int = self.in_flight // self.max_concurrency
+        return self.latency_seconds * (queued_rounds + 1)
+
+    def expected_cost(self, prompt: str) -> float:
+        return self.cost_per_1k_tokens * len(prompt) / 4 / 1000
+
+    def start_call(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def end_call(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def record_success(self, seconds: float) -> None:
+        with self._lock:
+            self.failures = 0
+            self.latency_seconds = (
+                seconds
+                if self.latency_seconds is None
+                else self.ewma_alpha * seconds
+                + (1 - self.ewma_alpha) * self.latency_seconds
+            )
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.unhealthy_until = time.time() + self.cooldown_seconds
+                logger.warning(
+                    f"Backend {self.name} marked unhealthy for {self.cooldown_seconds}s"
+                )
+
+
+class ModelRouter:
+    """
+    Picks a backend per request from a latency and cost budget, observed
+    latency and health, and falls back to the remaining backends on failure.
+    """
+
+    def __init__(self, backends: List[Backend]):
+        self.backends = backends
+
+    def _ranked(
+        self,
+        prompt: str,
+        max_latency_seconds: Optional[float],
+        max_cost: Optional[float],
+    ) -> List[Backend]:
+        healthy: List[Backend] = [b for b in self.backends if b.is_healthy()]
+        if not healthy:
+            # Everything is cooling down; trying is better than failing outright.
+            healthy = list(self.backends)
+
+        def _within_budget(backend: Backend) -> bool:
+            return (
+                max_latency_seconds is None
+                or backend.expected_latency() <= max_latency_seconds
+            ) and (max_cost is None or backend.expected_cost(prompt) <= max_cost)
+
+        in_budget: List[Backend] = sorted(
+            (b for b in healthy if _within_budget(b)),
+            key=lambda b: (b.expected_cost(prompt), b.expected_latency()),
+        )
+        over_budget: List[Backend] = sorted(
+            (b for b in healthy if not _within_budget(b)),
+            key=lambda b: b.expected_latency(),
+        )
+        return in_budget + over_budget
+
+    def complete(
+        self,
+        system_template: str,
+        human_template: str,
+        max_latency_seconds: Optional[float] = None,
+        max_cost: Optional[float] = None,
+    ) -> str:
+        """
+        Answers the prompt with the cheapest backend expected to meet the budget.
+        Each backend gets `max_latency_seconds` as its deadline; one that misses
+        it counts as failed and the next backend is tried.
+        Raises:
+            RuntimeError: If every backend failed.
+        """
+        prompt: str = f"{system_template}{human_template}"
+        errors: Dict[str, str] = {}
+        policy = CallPolicy(deadline_seconds=max_latency_seconds, max_retries=0)
+        for backend in self._ranked(prompt, max_latency_seconds, max_cost):
+            backend.start_call()
+            start: float = time.perf_counter()
+            try:
+                result: str = call_with_policy(
+                    backend.name,
+                    lambda timeout: backend.call(
+                        system_template, human_template, timeout
+                    ),
+                    policy,
+                )
+            except Exception as e:
+                backend.record_failure()
+                errors[backend.name] = str(e)
+                logger.warning(f"Backend {backend.name} failed: {e}")
+                continue
+            else:
+                seconds: float = time.perf_counter() - start
+                backend.record_success(seconds)
+                logger.debug(f"Routed to {backend.name} ({seconds:.2f}s)")
+                return result
+            finally:
+                backend.end_call()
+        raise RuntimeError(f"All backends failed: {errors}")
+
+    def stats(self) -> List[Dict[str, object]]:
+        return [
+            {
+                "name": backend.name,
+                "latency_seconds": backend.latency_seconds,
+                "in_flight": backend.in_flight,
+                "healthy": backend.is_healthy(),
+                "failures": backend.failures,
+            }
+            for backend in self.backends
+        ]
+
+
+def ollama_backend(
+    model: str = "llama2:7b", response_format: str = "json", **kwargs
+) -> Backend:
+    def _call(
+        system_template: str, human_template: str, timeout: Optional[float]
+    ) -> str:
+        result = generate_local_llm_response(
+            system_template,
+            human_template,
+            model=model,
+            response_format=response_format,
+            timeout=timeout,
+        )
+        if isinstance(result, str) and result.startswith("error: "):
+            raise LocalLLMError(result)
+        return result
+
+    return Backend(f"ollama:{model}", _call, max_concurrency=1, **kwargs)
+
+
+def openai_backend(
+    model: str = "gpt-4o-mini", cost_per_1k_tokens: float = 0.00015, **kwargs
+) -> Backend:
+    def _call(
+        system_template: str, human_template: str, timeout: Optional[float]
+    ) -> str:
+        return openai_create(
+            system_template, human_template, model=model, deadline_seconds=timeout
+        ).content
+
+    return Backend(
+        f"openai:{model}", _call, cost_per_1k_tokens=cost_per_1k_tokens, **kwargs
+    )
+
+
+def default_router(
+    local_model: str = "llama2:7b", openai_model: str = "gpt-4o-mini"
+) -> ModelRouter:
+    """
+    Local Ollama first while it keeps within budget, OpenAI as overflow and fallback.
+    """
+    return ModelRouter([ollama_backend(local_model), openai_backend(openai_model)])
+
+
+# Shared by every caller in the process, so latency history and health
+# carry over from one request to the next.
+router: ModelRouter = default_router()
@@ -0,0 +1,180 @@
+import tiktoken
+from functools import lru_cache
+from loguru import logger
+from typing import Any, Dict, List, Literal, Optional
+
+
+# Flat estimate for one image part: a 1024x1024 image at high detail.
+IMAGE_TOKENS_ESTIMATE: int = 765
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    """
+    Returns the tiktoken encoding for a model, or None when it cannot be loaded
+    (e.g. no network to fetch the BPE file), in which case counts fall back to
+    a characters/4 estimate.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"No tokenizer for {model}, estimating tokens: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    encoding: Optional[tiktoken.Encoding] = get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode_ordinary(text))
+
+
+def count_message_tokens(
+    messages: List[Dict[str, Any]], model: str = "gpt-4o-mini"
+) -> int:
+    """
+    Counts prompt tokens for chat messages, including the per-message framing
+    overhead and a flat estimate for image parts.
+    """
+    tokens: int = 3
+    for message in messages:
+        tokens += 3
+        content = message.get("content", "")
+        if isinstance(content, str):
+            tokens += count_tokens(content, model)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                tokens += count_tokens(part["text"], model)
+            elif part.get("image_url", {}).get("detail") == "low":
+                tokens += 85
+            else:
+                tokens += IMAGE_TOKENS_ESTIMATE
+    return tokens
+
+
+# Context window sizes used when ContextBudget is not given an explicit limit.
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4o": 128_000,
+    "gpt-4o-mini": 128_000,
+    "llama2:7b": 4_096,
+}
+
+
+def truncate_tokens(
+    text: str,
+    max_tokens: int,
+    model: str = "gpt-4o-mini",
+    keep: Literal["start", "end"] = "start",
+) -> str:
+    if max_tokens <= 0:
+        return ""
+    encoding: Optional[tiktoken.Encoding] = get_encoding(model)
+    if encoding is None:
+        max_chars: int = max_tokens * 4
+        return text[:max_chars] if keep == "start" else text[-max_chars:]
+    tokens: List[int] = encoding.encode_ordinary(text)
+    if len(tokens) <= max_tokens:
+        return text
+    kept = tokens[:max_tokens] if keep == "start" else tokens[-max_tokens:]
+    return encoding.decode(kept)
+
+
+class ContextBudget:
+    """
+    Builds a prompt from named sections under a token budget.
+
+    Sections are measured with the model's tokenizer. When the total is over
+    budget, sections are reduced from the lowest priority up: "drop" removes
+    the section, "keep_start"/"keep_end" trims it to what still fits (but not
+    below `min_tokens`, otherwise it is dropped). Sections with trim=None are
+    never touched. Per-section counts are logged on every build().
+    """
+
+    def __init__(
+        self,
+        model: str = "gpt-4o-mini",
+        max_tokens: Optional[int] = None,
+        reserved_tokens: int = 1_024,
+    ):
+        self.model = model
+        self.max_tokens = (
+            max_tokens
+            if max_tokens is not None
+            else MODEL_CONTEXT_WINDOWS.get(model, 8_192) - reserved_tokens
+        )
+        self.sections: List[Dict[str, Any]] = []
+
+    def add(
+        self,
+        name: str,
+        text: str,
+        priority: int = 0,
+        trim: Optional[Literal["drop", "keep_start", "keep_end"]] = "drop",
+        min_tokens: int = 0,
+    ) -> "ContextBudget":
+        self.sections.append(
+            {
+                "name": name,
+                "text": text,
+                "priority": priority,
+                "trim": trim,
+                "min_tokens": min_tokens,
+                "tokens": count_tokens(text, self.model),
+            }
+        )
+        return self
+
+    def fit(self) -> List[Dict[str, Any]]:
+        """
+        Returns the sections with "kept_text", "kept_tokens" and "status"
+        (kept, trimmed or dropped) after applying the budget.
+        """
+        fitted: List[Dict[str, Any]] = [
+            {**section, "kept_text": section["text"], "kept_tokens": section["tokens"]}
+            for section in self.sections
+        ]
+        for section in fitted:
+            section["status"] = "kept"
+        overflow: int = sum(s["kept_tokens"] for s in fitted) - self.max_tokens
+        by_priority = sorted(
+            (s for s in fitted if s["trim"] is not None),
+            key=lambda s: s["priority"],
+        )
+        for section in by_priority:
+            if overflow <= 0:
+                break
+            remaining: int = section["kept_tokens"] - overflow
+            if section["trim"] == "drop" or remaining < max(section["min_tokens"], 1):
+                overflow -= section["kept_tokens"]
+                section.update(kept_text="", kept_tokens=0, status="dropped")
+                continue
+            keep = "start" if section["trim"] == "keep_start" else "end"
+            section["kept_text"] = truncate_tokens(
+                section["text"], remaining, self.model, keep
+            )
+            section["kept_tokens"] = count_tokens(section["kept_text"], self.model)
+            section["status"] = "trimmed"
+            overflow = sum(s["kept_tokens"] for s in fitted) - self.max_tokens
+        if overflow > 0:
+            logger.warning(
+                f"Context is {overflow} tokens over the {self.max_tokens} token budget "
+                "after trimming all trimmable sections"
+            )
+        return fitted
+
+    def build(self, separator: str = "\n") -> str:
+        fitted = self.fit()
+        for section in fitted:
+            logger.debug(
+                f"Context section {section['name']} (priority {section['priority']}): "
+                f"{section['tokens']} -> {section['kept_tokens']} tokens, {section['status']}"
+            )
+        logger.info(
+            f"Context for {self.model}: {sum(s['kept_tokens'] for s in fitted)} of "
+            f"{self.max_tokens} budget tokens"
+        )
+        return separator.join(s["kept_text"] for s in fitted if s["kept_text"])
@@ -0,0 +1,469 @@
+import gc
+import multiprocessing
+import numpy as np
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from loguru import logger
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from utils_cache import LazyCache, SqliteCache, hash_file, make_cache_key
+
+
+# whisper.audio.SAMPLE_RATE; whisper (and torch) are imported only when a
+# model is actually loaded, which keeps importing this module cheap.
+SAMPLE_RATE: int = 16_000
+
+
+class WhisperModelRegistry:
+    """
+    Process-wide store of loaded Whisper models, one per (model name, device).
+
+    Models stay resident between calls. Loading a model that would push the
+    registry over `memory_budget_bytes` evicts the least recently used ones
+    first, and `evict_idle` drops models unused for `idle_timeout_seconds`.
+    """
+
+    def __init__(
+        self,
+        memory_budget_bytes: Optional[int] = None,
+        idle_timeout_seconds: Optional[float] = None,
+    ):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self._models: Dict[Tuple[str, str], Any] = {}
+        self._stats: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+
+    def get(self, model_name: str = "turbo", device: Optional[str] = None) -> Any:
+        key: Tuple[str, str] = (model_name, device or "auto")
+        with self._lock:
+            if key not in self._models:
+                self._load(key, model_name, device)
+            stats = self._stats[key]
+            stats["last_used"] = time.time()
+            stats["uses"] += 1
+            return self._models[key]
+
+    def _load(
+        self, key: Tuple[str, str], model_name: str, device: Optional[str]
+    ) -> None:
+        import whisper
+
+        start: float = time.perf_counter()
+        model = whisper.load_model(model_name, device=device)
+        load_seconds: float = time.perf_counter() - start
+        memory_bytes: int = _model_memory_bytes(model)
+        logger.info(
+            f"Loaded whisper model {model_name} on {key[1]} in {load_seconds:.2f}s "
+            f"({memory_bytes / 2**20:.0f} MiB)"
+        )
+        self._make_room(memory_bytes)
+        self._models[key] = model
+        self._stats[key] = {
+            "model": model_name,
+            "device": key[1],
+            "load_seconds": load_seconds,
+            "memory_bytes": memory_bytes,
+            "loaded_at": time.time(),
+            "last_used": time.time(),
+            "uses": 0,
+        }
+
+    def _make_room(self, incoming_bytes: int) -> None:
+        if self.memory_budget_bytes is None:
+            return
+        by_last_use = sorted(self._stats, key=lambda k: self._stats[k]["last_used"])
+        for key in by_last_use:
+            if self.resident_bytes() + incoming_bytes <= self.memory_budget_bytes:
+                break
+            self.evict(*key)
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(stats["memory_bytes"] for stats in self._stats.values())
+
+    def evict(self, model_name: str, device: str = "auto") -> bool:
+        with self._lock:
+            model = self._models.pop((model_name, device), None)
+            self._stats.pop((model_name, device), None)
+        if model is None:
+            return False
+        del model
+        gc.collect()
+        _empty_device_cache()
+        logger.info(f"Evicted whisper model {model_name} on {device}")
+        return True
+
+    def evict_idle(self) -> List[Tuple[str, str]]:
+        if self.idle_timeout_seconds is None:
+            return []
+        now: float = time.time()
+        with self._lock:
+            idle_keys = [
+                key
+                for key, stats in self._stats.items()
+                if now - stats["last_used"] > self.idle_timeout_seconds
+            ]
+        for key in idle_keys:
+            self.evict(*key)
+        return idle_keys
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(stats) for stats in self._stats.values()]
+
+
+def _model_memory_bytes(model: Any) -> int:
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+def _empty_device_cache() -> None:
+    import torch
+
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def _env_float(name: str) -> Optional[float]:
+    value: Optional[str] = os.getenv(name)
+    return float(value) if value else None
+
+
+_budget_mb: Optional[float] = _env_float("WHISPER_MEMORY_BUDGET_MB")
+whisper_models = WhisperModelRegistry(
+    memory_budget_bytes=int(_budget_mb * 2**20) if _budget_mb else None,
+    idle_timeout_seconds=_env_float("WHISPER_IDLE_TIMEOUT_SECONDS"),
+)
+
+
+def _open_transcription_cache(path: str) -> SqliteCache:
+    return SqliteCache(path, namespace="whisper")
+
+
+# Transcripts are deterministic for a given file, model and options, so the
+# cache is on unless WHISPER_CACHE_PATH is set to an empty string.
+transcription_cache: LazyCache[SqliteCache] = LazyCache(
+    "WHISPER_CACHE_PATH", ".cache/transcriptions.sqlite", _open_transcription_cache
+)
+
+
+def enable_transcription_cache(
+    path: str = ".cache/transcriptions.sqlite",
+) -> SqliteCache:
+    return transcription_cache.set(_open_transcription_cache(path))
+
+
+def disable_transcription_cache() -> None:
+    transcription_cache.set(None)
+
+
+# Approximate memory of one transcribe worker with its model loaded, in MiB
+# (the "Required VRAM" figures of the whisper README, similar in RAM on CPU).
+# Every worker process loads its own copy of the model.
+_WORKER_MEMORY_MB: Dict[str, int] = {
+    "tiny": 1024,
+    "base": 1024,
+    "small": 2048,
+    "medium": 5120,
+    "turbo": 6144,
+    "large": 10240,
+}
+# Default worker cap when WHISPER_MEMORY_BUDGET_MB is not set.
+WHISPER_MAX_WORKERS: int = int(os.getenv("WHISPER_MAX_WORKERS", 2))
+
+
+def _default_workers(model_name: str, tasks: int, cpu_count: int) -> int:
+    """
+    Half the CPU cores, but no more workers than fit in
+    WHISPER_MEMORY_BUDGET_MB, or WHISPER_MAX_WORKERS without a budget.
+    """
+    size: str = (
+        "turbo" if "turbo" in model_name else model_name.split("-")[0].split(".")[0]
+    )
+    per_worker_mb: int = _WORKER_MEMORY_MB.get(size, _WORKER_MEMORY_MB["large"])
+    memory_limit: int = (
+        int(_budget_mb // per_worker_mb) if _budget_mb else WHISPER_MAX_WORKERS
+    )
+    return max(1, min(tasks, cpu_count // 2, memory_limit))
+
+
+def _transcription_cache_key(
+    path: str, model_name: str, options: Dict[str, Any]
+) -> str:
+    return make_cache_key("whisper", hash_file(path), model_name, options)
+
+
+def _cached_transcription(key: Optional[str]) -> Optional[Dict[str, Any]]:
+    cache: Optional[SqliteCache] = transcription_cache.get()
+    if cache is None or key is None:
+        return None
+    return cache.get(key)
+
+
+def _store_transcription(key: Optional[str], result: Dict[str, Any]) -> None:
+    cache: Optional[SqliteCache] = transcription_cache.get()
+    if cache is not None and key is not None:
+        cache.set(key, result)
+
+
+def whisper_transcribe(
+    path: str,
+    model_name: str = "turbo",
+    full_response: bool = False,
+    device: Optional[str] = None,
+    **options: Any,
+) -> Union[Dict[str, Any], str]:
+    key: Optional[str] = (
+        _transcription_cache_key(path, model_name, options)
+        if transcription_cache.get() is not None
+        else None
+    )
+    result = _cached_transcription(key)
+    if result is None:
+        whisper_models.evict_idle()
+        model = whisper_models.get(model_name, device)
+        result = model.transcribe(path, **options)
+        _store_transcription(key, result)
+    return result if full_response else result["text"]
+
+
+def _split_on_silence(
+    audio: np.ndarray,
+    chunk_seconds: float = 300,
+    search_seconds: float = 15,
+    frame_seconds: float = 0.03,
+) -> List[Tuple[int, int]]:
+    """
+    Splits audio into spans of at most `chunk_seconds`, cutting at the quietest
+    frame (lowest RMS energy) within `search_seconds` before each boundary.
+    Returns:
+        List[Tuple[int, int]]: (start, end) sample indices of consecutive chunks.
+    """
+    sample_rate: int = SAMPLE_RATE
+    chunk_samples: int = int(chunk_seconds * sample_rate)
+    search_samples: int = int(search_seconds * sample_rate)
+    frame_samples: int = max(1, int(frame_seconds * sample_rate))
+    spans: List[Tuple[int, int]] = []
+    start: int = 0
+    while len(audio) - start > chunk_samples:
+        window_start: int = max(
+            start + frame_samples, start + chunk_samples - search_samples
+        )
+        window: np.ndarray = audio[window_start : start + chunk_samples]
+        frames_count: int = len(window) // frame_samples
+        frames = window[: frames_count * frame_samples].reshape(frames_count, -1)
+        energy = np.sqrt(np.mean(frames**2, axis=1))
+        cut: int = window_start + int(np.argmin(energy)) * frame_samples
+        spans.append((start, cut))
+        start = cut
+    spans.append((start, len(audio)))
+    return spans
+
+
+def _load_audio(path: str) -> np.ndarray:
+    """
+    Decodes a file to 16 kHz mono float32 with ffmpeg, as whisper.load_audio
+    does, but without importing whisper (and torch).
+    """
+    command: List[str] = [
+        "ffmpeg",
+        "-nostdin",
+        "-threads",
+        "0",
+        "-i",
+        path,
+        "-f",
+        "s16le",
+        "-ac",
+        "1",
+        "-acodec",
+        "pcm_s16le",
+        "-ar",
+        str(SAMPLE_RATE),
+        "-",
+    ]
+    try:
+        output: bytes = subprocess.run(command, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to load audio: {e.stderr.decode()}") from e
+    return np.frombuffer(output, np.int16).astype(np.float32) / 32768.0
+
+
+# The last file decoded in this process, so consecutive chunks of one
+# recording are decoded once while at most one recording is held in memory.
+_decoded: Dict[str, np.ndarray] = {}
+
+
+def _decoded_audio(path: str) -> np.ndarray:
+    if path not in _decoded:
+        _decoded.clear()
+        _decoded[path] = _load_audio(path)
+    return _decoded[path]
+
+
+def _init_transcribe_worker(
+    model_name: str, device: Optional[str], torch_threads: int
+) -> None:
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    whisper_models.get(model_name, device)
+
+
+def _transcribe_chunk(
+    path: str,
+    start: int,
+    end: int,
+    model_name: str,
+    device: Optional[str],
+    options: Dict[str, Any],
+) -> Dict[str, Any]:
+    offset_seconds: float = start / SAMPLE_RATE
+    result = whisper_models.get(model_name, device).transcribe(
+        _decoded_audio(path)[start:end], **options
+    )
+    for segment in result.get("segments", []):
+        segment["start"] += offset_seconds
+        segment["end"] += offset_seconds
+    return result
+
+
+def _stitch_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    segments: List[Dict[str, Any]] = []
+    for result in results:
+        for segment in result.get("segments", []):
+            segments.append({**segment, "id": len(segments)})
+    return {
+        "text": " ".join(result["text"].strip() for result in results),
+        "segments": segments,
+        "language": results[0].get("language") if results else None,
+    }
+
+
+def whisper_transcribe_many(
+    paths: List[str],
+    model_name: str = "turbo",
+    full_response: bool = False,
+    device: Optional[str] = None,
+    workers: Optional[int] = None,
+    torch_threads: Optional[int] = None,
+    chunk_seconds: float = 300,
+    **options: Any,
+) -> List[Union[Dict[str, Any], str]]:
+    """
+    Transcribes many audio files in parallel on a pool of worker processes.
+    Each worker loads the model once. With a single worker or a single chunk
+    there is no pool: the chunk runs in this process on the model held by
+    whisper_models. Recordings longer than `chunk_seconds`
+    are split at silences, transcribed in parallel and stitched back together
+    with segment timestamps shifted to the original timeline. Files already in
+    the transcription cache are served from it without starting the pool.
+    Args:
+        paths (List[str]): Audio files to transcribe.
+        workers (Optional[int]): Number of worker processes. Each holds its own
+            copy of the model (about 1 GiB for tiny/base up to 6 GiB for turbo
+            and 10 GiB for large), so the default is half the CPU cores capped
+            by WHISPER_MEMORY_BUDGET_MB, or by WHISPER_MAX_WORKERS (2) without it.
+        torch_threads (Optional[int]): Torch intra-op threads per worker. Defaults to
+            an even share of the CPU cores.
+        chunk_seconds (float): Maximum length of a single transcription chunk.
+    Returns:
+        List[Union[Dict[str, Any], str]]: Results in the same order as `paths`.
+    """
+    if not paths:
+        return []
+    keys: List[Optional[str]] = [
+        (
+            _transcription_cache_key(path, model_name, options)
+            if transcription_cache.get() is not None
+            else None
+        )
+        for path in paths
+    ]
+    results: List[Optional[Dict[str, Any]]] = [
+        _cached_transcription(key) for key in keys
+    ]
+    pending: List[int] = [
+        index for index, result in enumerate(results) if result is None
+    ]
+    if pending:
+        _transcribe_pending(
+            paths,
+            pending,
+            results,
+            model_name,
+            device,
+            workers,
+            torch_threads,
+            chunk_seconds,
+            options,
+        )
+        for index in pending:
+            _store_transcription(keys[index], results[index])
+    return results if full_response else [result["text"] for result in results]
+
+
+def _transcribe_pending(
+    paths: List[str],
+    pending: List[int],
+    results: List[Optional[Dict[str, Any]]],
+    model_name: str,
+    device: Optional[str],
+    workers: Optional[int],
+    torch_threads: Optional[int],
+    chunk_seconds: float,
+    options: Dict[str, Any],
+) -> None:
+    # Only chunk boundaries are kept; each task decodes its file again, so
+    # no process holds more than one recording in memory.
+    tasks: List[Tuple[int, int, int]] = []
+    for index in pending:
+        spans = _split_on_silence(_decoded_audio(paths[index]), chunk_seconds)
+        tasks += [(index, start, end) for start, end in spans]
+    cpu_count: int = os.cpu_count() or 1
+    workers = workers or _default_workers(model_name, len(tasks), cpu_count)
+    chunk_results: List[Dict[str, Any]]
+    if workers == 1 or len(tasks) == 1:
+        logger.info(
+            f"Transcribing {len(pending)} files as {len(tasks)} chunks in-process"
+        )
+        whisper_models.evict_idle()
+        chunk_results = [
+            _transcribe_chunk(paths[index], start, end, model_name, device, options)
+            for index, start, end in tasks
+        ]
+    else:
+        torch_threads = torch_threads or max(1, cpu_count // workers)
+        logger.info(
+            f"Transcribing {len(pending)} files as {len(tasks)} chunks on "
+            f"{workers} workers x {torch_threads} threads"
+        )
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_transcribe_worker,
+            initargs=(model_name, device, torch_threads),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _transcribe_chunk,
+                    paths[index],
+                    start,
+                    end,
+                    model_name,
+                    device,
+                    options,
+                )
+                for index, start, end in tasks
+            ]
+            chunk_results = [future.result() for future in futures]
+    _decoded.clear()
+    per_file: Dict[int, List[Dict[str, Any]]] = {index: [] for index in pending}
+    for (index, _, _), result in zip(tasks, chunk_results):
+        per_file[index].append(result)
+    for index, file_results in per_file.items():
+        results[index] = _stitch_results(file_results)